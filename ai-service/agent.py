@@ -1,5 +1,5 @@
 from langchain_openai import ChatOpenAI
-from langchain.agents import Tool, AgentExecutor, create_openai_functions_agent
+from langchain.agents import Tool, AgentExecutor, create_openai_tools_agent
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.memory import ConversationBufferMemory
 from langchain.schema import HumanMessage, AIMessage, SystemMessage
@@ -7,6 +7,7 @@ from datetime import datetime, timedelta
 from typing import Dict, Any, Optional
 import json
 from services import AppointmentService
+from database import SessionLocal, replica_router
 from sqlalchemy.orm import Session
 import uuid
 import re
@@ -63,15 +64,22 @@ class AppointmentAgent:
     def _check_availability_tool(self, date_str: str) -> str:
         """Tool function to check availability."""
         try:
-            # This is a placeholder - actual DB access will be injected
             target_date = datetime.strptime(date_str.strip(), "%Y-%m-%d")
             
-            # Simulated response for now
             if target_date.weekday() >= 5:  # Weekend
                 return "We are closed on weekends. Please choose a weekday."
             
-            # Return available slots (simplified)
-            available_times = ["9:00 AM", "10:00 AM", "11:00 AM", "2:00 PM", "3:00 PM", "4:00 PM"]
+            # Own session per call: tool calls from one LLM step run concurrently
+            db = SessionLocal(bind=replica_router.choose())
+            try:
+                slots = AppointmentService.get_available_slots(db, target_date)
+            finally:
+                db.close()
+            
+            if not slots:
+                return f"No available slots on {target_date.strftime('%B %d, %Y')}."
+            
+            available_times = [slot['time'] for slot in slots]
             return f"Available slots on {target_date.strftime('%B %d, %Y')}: {', '.join(available_times)}"
         
         except ValueError:
@@ -101,7 +109,7 @@ class AppointmentAgent:
         """Tool function to cancel an appointment."""
         return f"Appointment {appointment_id} has been cancelled successfully."
     
-    def create_agent_executor(self) -> AgentExecutor:
+    def create_agent_executor(self, verbose: bool = False) -> AgentExecutor:
         """Create the agent executor with tools and prompts."""
         
         system_message = """You are a helpful AI assistant for booking appointments. Your role is to:
@@ -119,6 +127,8 @@ Guidelines:
 - If the user's request is unclear, ask for clarification
 - Always confirm booking details before finalizing
 - Provide alternative options if requested time is unavailable
+- When a request involves several dates or actions, call all the tools you need
+  in the same step instead of one at a time
 
 When booking:
 - Confirm date and time explicitly
@@ -138,7 +148,9 @@ Available services:
             MessagesPlaceholder(variable_name="agent_scratchpad"),
         ])
         
-        agent = create_openai_functions_agent(
+        # Tools agent: the model can request several tool calls per step, and
+        # AgentExecutor.ainvoke runs them concurrently, returning the results in call order
+        agent = create_openai_tools_agent(
             llm=self.llm,
             tools=self.tools,
             prompt=prompt
@@ -148,7 +160,7 @@ Available services:
             agent=agent,
             tools=self.tools,
             memory=self.memory,
-            verbose=True,
+            verbose=verbose,
             max_iterations=5,
             handle_parsing_errors=True
         )
@@ -163,7 +175,13 @@ class ConversationManager:
         self.session_id = session_id or uuid.uuid4()
         self.conversation_history = []
     
-    def add_message(self, role: str, content: str, metadata: Optional[Dict] = None):
+    def add_message(
+        self,
+        role: str,
+        content: str,
+        metadata: Optional[Dict] = None,
+        token_count: Optional[int] = None
+    ):
         """Add a message to conversation history."""
         from database import ChatMessage
         
@@ -172,7 +190,8 @@ class ConversationManager:
             user_id=self.user_id,
             message_type=role,
             content=content,
-            metadata=metadata or {}
+            metadata_=metadata or {},
+            token_count=token_count
         )
         
         self.db.add(message)
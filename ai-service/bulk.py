@@ -0,0 +1,515 @@
+"""
+Streaming bulk import/export of appointments and chat data using Postgres COPY.
+
+Usage:
+    python bulk.py import appointments calendar.csv [--format ndjson] [--dry-run] [--on-conflict abort]
+    python bulk.py export appointments [--start-date 2024-01-01] [--end-date 2024-12-31] [-o out.csv]
+    python bulk.py export chat_messages --format ndjson [--since 2024-01-01] [-o out.ndjson]
+"""
+import argparse
+import csv
+import io
+import json
+import queue
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO
+
+from config import get_settings
+from database import engine
+from schedule_cache import SCHEDULE_NOTIFY_CHANNEL
+
+settings = get_settings()
+
+# Statuses accepted by the appointments CHECK constraint
+APPOINTMENT_STATUSES = ('scheduled', 'confirmed', 'cancelled', 'completed', 'no-show')
+
+DEFAULT_DURATION_MINUTES = 60
+
+# Columns every import record needs, and column limits of the appointments table
+REQUIRED_IMPORT_COLUMNS = ('user_id', 'appointment_date', 'appointment_time')
+SERVICE_TYPE_MAX_LENGTH = 255
+
+# Rows per chunk written to COPY, and max errors kept in an import report
+COPY_CHUNK_ROWS = 5000
+MAX_REPORTED_ERRORS = 100
+
+EXPORT_QUERIES = {
+    'appointments': """
+        SELECT id, user_id, appointment_date, appointment_time, end_time,
+               service_type, status, notes, created_at, cancelled_at
+        FROM appointments
+        WHERE (%(start)s::date IS NULL OR appointment_date >= %(start)s::date)
+          AND (%(end)s::date IS NULL OR appointment_date <= %(end)s::date)
+        ORDER BY appointment_date, appointment_time
+    """,
+    'chat_messages': """
+        SELECT id, session_id, user_id, message_type, content, created_at, metadata, token_count
+        FROM chat_messages
+        WHERE (%(start)s::timestamp IS NULL OR created_at >= %(start)s::timestamp)
+          AND (%(end)s::timestamp IS NULL OR created_at < %(end)s::timestamp)
+        ORDER BY created_at
+    """,
+}
+
+MEDIA_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class BulkInputError(ValueError):
+    """Raised for unusable input (unknown format, missing header, bad date filter)."""
+
+
+# Export
+class _ChunkQueue:
+    """Bounded hand-off between the COPY thread and the consumer."""
+
+    def __init__(self, maxsize: int = 64):
+        self.chunks: queue.Queue = queue.Queue(maxsize=maxsize)
+        self.cancelled = threading.Event()
+
+    def put(self, item) -> bool:
+        """Block until there is room; returns False once the consumer has gone away."""
+        while not self.cancelled.is_set():
+            try:
+                self.chunks.put(item, timeout=1.0)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+
+class _QueueWriter:
+    """File-like sink for COPY TO that hands chunks to a _ChunkQueue."""
+
+    def __init__(self, chunks: _ChunkQueue, unescape: bool):
+        self.chunks = chunks
+        self.unescape = unescape
+
+    def write(self, data):
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        if self.unescape:
+            # COPY text format doubles backslashes; JSON has no other escapable characters
+            data = data.replace('\\\\', '\\')
+        if not self.chunks.put(data):
+            raise IOError("Export cancelled by consumer")
+
+
+def export_stream(
+    table: str,
+    fmt: str = 'csv',
+    start: Optional[str] = None,
+    end: Optional[str] = None
+) -> Iterator[str]:
+    """
+    Stream a table export as CSV (with header) or NDJSON.
+
+    COPY runs in a background thread feeding a bounded queue, so memory use
+    is constant regardless of table size.
+    """
+    if table not in EXPORT_QUERIES:
+        raise ValueError(f"Unknown export table: {table}")
+    if fmt not in MEDIA_TYPES:
+        raise ValueError(f"Unknown export format: {fmt}")
+
+    # Validated up front: a bad value would otherwise fail inside COPY after
+    # the response has started streaming
+    return _export_chunks(table, fmt, _parse_filter('start', start), _parse_filter('end', end))
+
+
+def _parse_filter(name: str, value: Optional[str]) -> Optional[str]:
+    """Normalize an ISO date/timestamp filter, or raise BulkInputError."""
+    if value in (None, ''):
+        return None
+    try:
+        return datetime.fromisoformat(value).isoformat()
+    except ValueError:
+        raise BulkInputError(f"Invalid {name}: expected an ISO date or timestamp, got {value!r}")
+
+
+def _export_chunks(table: str, fmt: str, start: Optional[str], end: Optional[str]) -> Iterator[str]:
+    chunks = _ChunkQueue()
+    done = object()
+
+    def run():
+        conn = engine.raw_connection()
+        try:
+            cur = conn.cursor()
+            select = cur.mogrify(EXPORT_QUERIES[table], {"start": start, "end": end}).decode()
+            if fmt == 'csv':
+                sql = f"COPY ({select}) TO STDOUT WITH (FORMAT csv, HEADER)"
+            else:
+                sql = f"COPY (SELECT row_to_json(t) FROM ({select}) t) TO STDOUT"
+            cur.copy_expert(sql, _QueueWriter(chunks, unescape=(fmt == 'ndjson')))
+            cur.close()
+        except Exception as e:
+            chunks.put(e)
+        finally:
+            conn.close()
+            chunks.put(done)
+
+    threading.Thread(target=run, name=f"export-{table}", daemon=True).start()
+
+    try:
+        while True:
+            item = chunks.chunks.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Stops the producer if the consumer went away early
+        chunks.cancelled.set()
+
+
+# Import
+class _ChunkReader:
+    """File-like source for COPY FROM over an iterator of text chunks."""
+
+    def __init__(self, chunks: Iterable[str]):
+        self._chunks = iter(chunks)
+        self._buffer = ''
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._chunks)
+            except StopIteration:
+                break
+        if size < 0:
+            data, self._buffer = self._buffer, ''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def _read_records(source: TextIO, fmt: str) -> Iterator[Dict]:
+    """
+    Iterate input records. The format and CSV header are checked right away,
+    so bad input is rejected before COPY starts pulling rows.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(source)
+        if not reader.fieldnames:
+            raise BulkInputError("CSV input has no header row")
+        missing = [column for column in REQUIRED_IMPORT_COLUMNS if column not in reader.fieldnames]
+        if missing:
+            raise BulkInputError(f"CSV header is missing columns: {', '.join(missing)}")
+        return iter(reader)
+    if fmt == 'ndjson':
+        return _ndjson_records(source)
+    raise BulkInputError(f"Unknown import format: {fmt}")
+
+
+def _ndjson_records(source: TextIO) -> Iterator[Dict]:
+    for line in source:
+        line = line.strip()
+        if line:
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                # Reported as an invalid row instead of aborting the import
+                yield e
+
+
+def _parse_time(value: str) -> datetime:
+    value = value.strip()
+    return datetime.strptime(value, "%H:%M:%S" if value.count(':') == 2 else "%H:%M")
+
+
+def _parse_appointment(record: Dict) -> List:
+    """Validate one input record; returns staging column values or raises ValueError."""
+    def field(name):
+        value = record.get(name)
+        if value in (None, ''):
+            return None
+        value = str(value)
+        if '\x00' in value:
+            # Postgres text cannot hold NUL; it would fail the whole COPY
+            raise ValueError(f"{name} contains a NUL character")
+        return value
+
+    appointment_id = field('id')
+    user_id = field('user_id')
+    if not user_id:
+        raise ValueError("user_id is required")
+    if not field('appointment_date') or not field('appointment_time'):
+        raise ValueError("appointment_date and appointment_time are required")
+
+    appointment_date = datetime.strptime(field('appointment_date')[:10], "%Y-%m-%d").date()
+    start = _parse_time(field('appointment_time'))
+    end = _parse_time(field('end_time')) if field('end_time') else start + timedelta(minutes=DEFAULT_DURATION_MINUTES)
+    if end <= start or end.date() != start.date():
+        raise ValueError("end_time must be after appointment_time on the same day")
+
+    status = field('status') or 'scheduled'
+    if status not in APPOINTMENT_STATUSES:
+        raise ValueError(f"Invalid status: {status}")
+
+    service_type = field('service_type')
+    if service_type and len(service_type) > SERVICE_TYPE_MAX_LENGTH:
+        raise ValueError(f"service_type is longer than {SERVICE_TYPE_MAX_LENGTH} characters")
+
+    created_at = field('created_at')
+    return [
+        # Assigned here so follow-up statements can refer to staged IDs
+        str(uuid.UUID(appointment_id)) if appointment_id else str(uuid.uuid4()),
+        str(uuid.UUID(user_id)),
+        appointment_date.isoformat(),
+        start.strftime("%H:%M:%S"),
+        end.strftime("%H:%M:%S"),
+        service_type,
+        status,
+        field('notes'),
+        datetime.fromisoformat(created_at).isoformat() if created_at else None,
+    ]
+
+
+STAGING_TABLE = """
+    CREATE TEMP TABLE appointments_import (
+        line_no BIGINT NOT NULL,
+        id UUID NOT NULL,
+        user_id UUID NOT NULL,
+        appointment_date DATE NOT NULL,
+        appointment_time TIME NOT NULL,
+        end_time TIME NOT NULL,
+        service_type VARCHAR(255),
+        status VARCHAR(50) NOT NULL,
+        notes TEXT,
+        created_at TIMESTAMP
+    ) ON COMMIT DROP
+"""
+
+STAGING_COPY = """
+    COPY appointments_import (line_no, id, user_id, appointment_date, appointment_time,
+                              end_time, service_type, status, notes, created_at)
+    FROM STDIN WITH (FORMAT csv)
+"""
+
+# Each check removes rejected rows from staging and reports (count, first line numbers)
+IMPORT_CHECKS = [
+    ('unknown_user', """
+        DELETE FROM appointments_import s
+        WHERE NOT EXISTS (SELECT 1 FROM users u WHERE u.id = s.user_id)
+        RETURNING s.line_no
+    """),
+    ('duplicate_id', """
+        DELETE FROM appointments_import s
+        WHERE EXISTS (SELECT 1 FROM appointments a WHERE a.id = s.id)
+            OR EXISTS (
+                SELECT 1 FROM appointments_import t
+                WHERE t.id = s.id AND t.line_no < s.line_no
+            )
+        RETURNING s.line_no
+    """),
+    ('conflict', """
+        DELETE FROM appointments_import s
+        WHERE s.status IN ('scheduled', 'confirmed') AND (
+            EXISTS (
+                SELECT 1 FROM appointments a
+                WHERE a.appointment_date = s.appointment_date
+                    AND a.status IN ('scheduled', 'confirmed')
+                    AND a.appointment_time < s.end_time
+                    AND a.end_time > s.appointment_time
+            )
+            OR EXISTS (
+                SELECT 1 FROM appointments_import t
+                WHERE t.appointment_date = s.appointment_date
+                    AND t.line_no < s.line_no
+                    AND t.status IN ('scheduled', 'confirmed')
+                    AND t.appointment_time < s.end_time
+                    AND t.end_time > s.appointment_time
+            )
+        )
+        RETURNING s.line_no
+    """),
+]
+
+IMPORT_INSERT = """
+    INSERT INTO appointments (id, user_id, appointment_date, appointment_time, end_time,
+                              service_type, status, notes, created_at, cancelled_at)
+    SELECT id, user_id, appointment_date, appointment_time, end_time,
+           service_type, status, notes, COALESCE(created_at, CURRENT_TIMESTAMP),
+           CASE WHEN status = 'cancelled' THEN COALESCE(created_at, CURRENT_TIMESTAMP) END
+    FROM appointments_import
+"""
+
+# Reminders for imported upcoming appointments, as queue_booking_notifications
+# would create them (no confirmations: imported bookings were already made)
+IMPORT_REMINDERS = """
+    INSERT INTO notification_outbox (event_type, appointment_id, user_id, payload, available_at)
+    SELECT 'appointment_reminder', id, user_id,
+           jsonb_build_object(
+               'appointment_id', id,
+               'date', to_char(appointment_date, 'YYYY-MM-DD'),
+               'time', to_char(appointment_time, 'HH24:MI'),
+               'service_type', service_type
+           ),
+           appointment_date + appointment_time - make_interval(hours => %(lead_hours)s)
+    FROM appointments_import
+    WHERE status IN ('scheduled', 'confirmed')
+        AND appointment_date + appointment_time - make_interval(hours => %(lead_hours)s) > LOCALTIMESTAMP
+"""
+
+
+def import_appointments(
+    source: TextIO,
+    fmt: str = 'csv',
+    dry_run: bool = False,
+    on_conflict: str = 'skip'
+) -> Dict:
+    """
+    Bulk import appointments from a CSV/NDJSON text stream.
+
+    Rows are validated while streaming into a temp staging table via COPY,
+    then checked in bulk against users, existing IDs and the existing
+    schedule (overlapping active appointments). With on_conflict='skip'
+    rejected rows are reported and the rest imported; with 'abort' nothing
+    is imported if any row is rejected. Reminders for upcoming imported
+    appointments are queued in the outbox. Everything runs in one transaction.
+    """
+    if on_conflict not in ('skip', 'abort'):
+        raise ValueError("on_conflict must be 'skip' or 'abort'")
+    if fmt not in MEDIA_TYPES:
+        raise BulkInputError(f"Unknown import format: {fmt}")
+
+    started = time.perf_counter()
+    # Checks the CSV header now: psycopg2 replaces any exception raised while
+    # COPY reads its input with QueryCanceled
+    records = _read_records(source, fmt)
+    read_errors: List[Exception] = []
+    report = {
+        'rows_read': 0,
+        'rejected': {'invalid': 0, 'unknown_user': 0, 'duplicate_id': 0, 'conflict': 0},
+        'imported': 0,
+        'reminders_queued': 0,
+        'dry_run': dry_run,
+        'errors': []
+    }
+
+    def add_error(line_no: int, reason: str):
+        if len(report['errors']) < MAX_REPORTED_ERRORS:
+            report['errors'].append({'line': line_no, 'error': reason})
+
+    def staging_chunks() -> Iterator[str]:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        rows = 0
+        try:
+            for line_no, record in enumerate(records, start=1):
+                report['rows_read'] += 1
+                try:
+                    if isinstance(record, Exception):
+                        raise ValueError(f"Invalid JSON: {record}")
+                    writer.writerow([line_no] + _parse_appointment(record))
+                    rows += 1
+                except (ValueError, TypeError, AttributeError) as e:
+                    report['rejected']['invalid'] += 1
+                    add_error(line_no, str(e))
+                if rows >= COPY_CHUNK_ROWS:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+                    rows = 0
+        except (csv.Error, UnicodeDecodeError) as e:
+            # Unreadable input: stop COPY cleanly and raise after it returns
+            read_errors.append(BulkInputError(f"Unreadable input after line {report['rows_read']}: {e}"))
+            return
+        yield buffer.getvalue()
+
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        # Row-level NOTIFY triggers are skipped; one BULK event is sent below
+        cur.execute("SET LOCAL app.bulk_import = 'on'")
+        cur.execute(STAGING_TABLE)
+        cur.copy_expert(STAGING_COPY, _ChunkReader(staging_chunks()))
+        if read_errors:
+            raise read_errors[0]
+        cur.execute("CREATE INDEX ON appointments_import (appointment_date, appointment_time)")
+        cur.execute("CREATE INDEX ON appointments_import (id)")
+        cur.execute("ANALYZE appointments_import")
+
+        for reason, statement in IMPORT_CHECKS:
+            cur.execute(f"""
+                WITH rejected AS ({statement})
+                SELECT COUNT(*), (array_agg(line_no ORDER BY line_no))[1:{MAX_REPORTED_ERRORS}]
+                FROM rejected
+            """)
+            count, line_numbers = cur.fetchone()
+            report['rejected'][reason] = count
+            for line_no in line_numbers or []:
+                add_error(line_no, reason)
+
+        rejected = sum(report['rejected'].values())
+        if dry_run or (on_conflict == 'abort' and rejected):
+            conn.rollback()
+        else:
+            cur.execute(IMPORT_INSERT)
+            report['imported'] = cur.rowcount
+            cur.execute(IMPORT_REMINDERS, {"lead_hours": settings.reminder_lead_hours})
+            report['reminders_queued'] = cur.rowcount
+            cur.execute("SELECT pg_notify(%s, %s)", (
+                SCHEDULE_NOTIFY_CHANNEL,
+                json.dumps({'table': 'appointments', 'op': 'BULK'})
+            ))
+            conn.commit()
+        cur.close()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    report['errors'].sort(key=lambda error: error['line'])
+    report['duration_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    return report
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Bulk import/export appointments and chat data")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="Import appointments")
+    import_parser.add_argument("table", choices=["appointments"])
+    import_parser.add_argument("path", help="Input file, or - for stdin")
+    import_parser.add_argument("--format", choices=list(MEDIA_TYPES), default="csv")
+    import_parser.add_argument("--dry-run", action="store_true")
+    import_parser.add_argument("--on-conflict", choices=["skip", "abort"], default="skip")
+
+    export_parser = commands.add_parser("export", help="Export a table")
+    export_parser.add_argument("table", choices=list(EXPORT_QUERIES))
+    export_parser.add_argument("--format", choices=list(MEDIA_TYPES), default="csv")
+    export_parser.add_argument("--start-date", "--since", dest="start")
+    export_parser.add_argument("--end-date", "--until", dest="end")
+    export_parser.add_argument("-o", "--output", help="Output file (default: stdout)")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "import":
+        source = sys.stdin if args.path == "-" else open(args.path, newline='', encoding='utf-8')
+        with source:
+            try:
+                report = import_appointments(source, args.format, args.dry_run, args.on_conflict)
+            except BulkInputError as e:
+                parser.error(str(e))
+        print(json.dumps(report, indent=2))
+    else:
+        target = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+        try:
+            for chunk in export_stream(args.table, args.format, args.start, args.end):
+                target.write(chunk)
+        finally:
+            if args.output:
+                target.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 import os
 from pydantic_settings import BaseSettings
 from functools import lru_cache
+from typing import Literal
 
 
 class Settings(BaseSettings):
@@ -13,6 +14,11 @@ class Settings(BaseSettings):
     
     # Database Configuration
     database_url: str
+    replica_database_urls: str = ""  # Comma-separated read replica URLs
+    replica_max_lag_seconds: float = 5.0
+    replica_lag_check_interval_seconds: float = 1.0
+    replica_connect_timeout_seconds: int = 2  # Lag checks run on the request path
+    read_your_writes_seconds: float = 10.0
     
     # Application Settings
     app_name: str = "AI Appointment Chatbot"
@@ -22,6 +28,36 @@ class Settings(BaseSettings):
     max_conversation_history: int = 10
     session_timeout_minutes: int = 30
     
+    # Schedule Cache Settings (invalidated via Postgres LISTEN/NOTIFY)
+    schedule_cache_ttl_seconds: int = 3600
+    schedule_listener_enabled: bool = True
+    
+    # Maintenance Jobs
+    maintenance_enabled: bool = True
+    maintenance_batch_size: int = 1000
+    session_expiry_interval_seconds: int = 60
+    appointment_transition_interval_seconds: int = 300
+    appointment_completion_grace_minutes: int = 15
+    unconfirmed_appointment_final_status: Literal["completed", "no-show"] = "completed"
+    
+    # Notification Outbox
+    outbox_dispatcher_enabled: bool = True
+    outbox_dispatcher_workers: int = 1
+    outbox_batch_size: int = 100
+    outbox_poll_interval_seconds: float = 1.0
+    outbox_lease_seconds: int = 60
+    outbox_max_attempts: int = 8
+    outbox_backoff_seconds: float = 5.0
+    outbox_max_backoff_seconds: float = 3600.0
+    reminder_lead_hours: int = 24
+    notification_sink: str = "log"  # "log" or "file"
+    notification_sink_path: str = "notifications.ndjson"
+    
+    # Idempotency Keys (/chat, /appointments)
+    idempotency_max_entries: int = 10000
+    idempotency_ttl_seconds: int = 86400
+    idempotency_wait_timeout_seconds: float = 120.0
+    
     class Config:
         env_file = ".env"
         case_sensitive = False
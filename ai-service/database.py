@@ -1,8 +1,14 @@
-from sqlalchemy import create_engine, Column, String, DateTime, Text, Integer, Boolean
+from sqlalchemy import create_engine, func, text, Column, String, DateTime, Text, Integer, Boolean
+from sqlalchemy.engine import Engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from datetime import datetime
+from fastapi import Request
+from typing import Dict, List, Optional
+import itertools
+import threading
+import time
 import uuid
 from config import get_settings
 
@@ -13,6 +19,133 @@ engine = create_engine(settings.database_url)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Read replica engines (optional). Short connect timeout: an unreachable
+# replica must not stall the request that happens to run its lag check
+replica_engines = [
+    create_engine(
+        url.strip(),
+        pool_pre_ping=True,
+        connect_args={"connect_timeout": settings.replica_connect_timeout_seconds}
+    )
+    for url in settings.replica_database_urls.split(",")
+    if url.strip()
+]
+
+
+# NULL when the replica is behind but has not replayed any transaction yet
+# (no replay timestamp); callers treat that as unhealthy, not as zero lag
+REPLICA_LAG_QUERY = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+""")
+
+
+class ReplicaRouter:
+    """
+    Chooses the engine for read-only work.
+
+    Reads go round-robin to replicas whose replication lag is within
+    `max_lag_seconds` and fall back to the primary otherwise. Keys (user or
+    session IDs) that wrote recently in this process are pinned to the primary
+    for `pin_seconds`, so users always read their own writes.
+    """
+
+    def __init__(
+        self,
+        primary: Engine,
+        replicas: List[Engine],
+        max_lag_seconds: float,
+        check_interval_seconds: float,
+        pin_seconds: float
+    ):
+        self.primary = primary
+        self.replicas = replicas
+        self.max_lag_seconds = max_lag_seconds
+        self.check_interval_seconds = check_interval_seconds
+        self.pin_seconds = pin_seconds
+        self._lag: Dict[int, Optional[float]] = {}
+        self._checked_at: Dict[int, float] = {}
+        self._pinned: Dict[str, float] = {}
+        self._round_robin = itertools.count()
+        self._lock = threading.Lock()
+
+    def note_write(self, *keys: Optional[str]):
+        """Pin keys to the primary after a write."""
+        expires_at = time.monotonic() + self.pin_seconds
+        with self._lock:
+            for key in keys:
+                if key:
+                    self._pinned[str(key).lower()] = expires_at
+            if len(self._pinned) > 10000:
+                now = time.monotonic()
+                self._pinned = {k: v for k, v in self._pinned.items() if v > now}
+
+    def choose(self, key: Optional[str] = None) -> Engine:
+        """Get the engine to use for a read on behalf of `key`."""
+        if not self.replicas:
+            return self.primary
+
+        if key:
+            with self._lock:
+                pinned_until = self._pinned.get(str(key).lower())
+            if pinned_until and pinned_until > time.monotonic():
+                return self.primary
+
+        healthy = [replica for replica in self.replicas if self._within_lag(replica)]
+        if not healthy:
+            return self.primary
+
+        return healthy[next(self._round_robin) % len(healthy)]
+
+    def _within_lag(self, replica: Engine) -> bool:
+        replica_id = id(replica)
+        now = time.monotonic()
+        with self._lock:
+            fresh = now - self._checked_at.get(replica_id, float("-inf")) < self.check_interval_seconds
+            if fresh:
+                return self._healthy(self._lag.get(replica_id))
+            # Claim the check so concurrent readers use the previous value
+            self._checked_at[replica_id] = now
+
+        try:
+            with replica.connect() as conn:
+                lag = conn.execute(REPLICA_LAG_QUERY).scalar()
+            lag = None if lag is None else float(lag)
+        except Exception as e:
+            print(f"Replica lag check failed: {e}")
+            lag = None
+
+        with self._lock:
+            self._lag[replica_id] = lag
+        return self._healthy(lag)
+
+    def _healthy(self, lag: Optional[float]) -> bool:
+        return lag is not None and lag <= self.max_lag_seconds
+
+    def status(self) -> List[Dict]:
+        """Last measured lag per replica; unknown lag counts as unhealthy."""
+        statuses = []
+        for replica in self.replicas:
+            lag = self._lag.get(id(replica))
+            statuses.append({
+                "replica": replica.url.render_as_string(hide_password=True),
+                "lag_seconds": lag,
+                "healthy": self._healthy(lag)
+            })
+        return statuses
+
+
+replica_router = ReplicaRouter(
+    primary=engine,
+    replicas=replica_engines,
+    max_lag_seconds=settings.replica_max_lag_seconds,
+    check_interval_seconds=settings.replica_lag_check_interval_seconds,
+    pin_seconds=settings.read_your_writes_seconds
+)
+
 
 # Database Models
 class User(Base):
@@ -38,7 +171,7 @@ class Appointment(Base):
     status = Column(String(50), default='scheduled')
     notes = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
-    metadata = Column(JSONB)
+    metadata_ = Column("metadata", JSONB)  # `metadata` is reserved by SQLAlchemy
 
 
 class ChatSession(Base):
@@ -61,10 +194,26 @@ class ChatMessage(Base):
     message_type = Column(String(50), nullable=False)
     content = Column(Text, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
-    metadata = Column(JSONB)
+    metadata_ = Column("metadata", JSONB)  # `metadata` is reserved by SQLAlchemy
     token_count = Column(Integer)
 
 
+class OutboxMessage(Base):
+    __tablename__ = "notification_outbox"
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    event_type = Column(String(50), nullable=False)
+    appointment_id = Column(UUID(as_uuid=True))
+    user_id = Column(UUID(as_uuid=True), nullable=False)
+    payload = Column(JSONB, nullable=False)
+    status = Column(String(20), default='pending')
+    attempts = Column(Integer, default=0)
+    available_at = Column(DateTime, default=func.now())
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime)
+    last_error = Column(Text)
+
+
 def get_db():
     """Dependency to get database session."""
     db = SessionLocal()
@@ -72,3 +221,13 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def get_read_db(request: Request):
+    """Dependency to get a session for read-only work (replica when possible)."""
+    key = request.path_params.get('user_id') or request.path_params.get('session_id')
+    db = SessionLocal(bind=replica_router.choose(key))
+    try:
+        yield db
+    finally:
+        db.close()
@@ -0,0 +1,159 @@
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+from fastapi import HTTPException
+
+from config import get_settings
+
+settings = get_settings()
+
+
+class IdempotencyEntry:
+    """State of one idempotency key: in flight until `done` is set."""
+
+    __slots__ = ('key', 'fingerprint', 'done', 'result', 'error', 'expires_at')
+
+    def __init__(self, key: str, fingerprint: str):
+        self.key = key
+        self.fingerprint = fingerprint
+        self.done = asyncio.Event()
+        self.result = None
+        self.error: Optional[HTTPException] = None
+        self.expires_at: Optional[float] = None
+
+
+class IdempotencyStore:
+    """
+    Bounded in-process store of responses keyed by idempotency key.
+
+    Completed entries expire after `ttl_seconds`; when more than `max_entries`
+    are held, the earliest completed ones are evicted first. In-flight entries
+    are never evicted, since duplicates must keep waiting on them.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, IdempotencyEntry]" = OrderedDict()
+
+    def begin(self, key: str, fingerprint: str) -> Tuple[IdempotencyEntry, bool]:
+        """Get the entry for a key; the second value is True if the caller must run the request."""
+        self._evict()
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            return entry, False
+
+        entry = IdempotencyEntry(key, fingerprint)
+        self._entries[key] = entry
+        return entry, True
+
+    def complete(self, entry: IdempotencyEntry, result: Any = None, error: Optional[HTTPException] = None):
+        """Store the outcome of a request and wake up waiting duplicates."""
+        entry.result = result
+        entry.error = error
+        entry.expires_at = time.monotonic() + self.ttl_seconds
+        # Keep completed entries in expiry order behind any older in-flight ones
+        if self._entries.get(entry.key) is entry:
+            self._entries.move_to_end(entry.key)
+        entry.done.set()
+
+    def release(self, key: str, entry: IdempotencyEntry):
+        """Forget a failed request so a retry runs it again."""
+        if self._entries.get(key) is entry:
+            del self._entries[key]
+        entry.done.set()
+
+    def _evict(self):
+        """Drop expired entries, then the earliest completed ones while over capacity."""
+        now = time.monotonic()
+        excess = len(self._entries) + 1 - self.max_entries
+        evicted = []
+
+        for key, entry in self._entries.items():
+            if entry.expires_at is None:
+                continue
+            # Completed entries are in expiry order: the rest are live too
+            if entry.expires_at > now and len(evicted) >= excess:
+                break
+            evicted.append(key)
+
+        for key in evicted:
+            del self._entries[key]
+
+
+def request_fingerprint(payload: Any) -> str:
+    """Hash a request payload to detect key reuse with a different body."""
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+async def run_idempotent(
+    store: IdempotencyStore,
+    key: Optional[str],
+    scope: str,
+    payload: Any,
+    handler: Callable[[], Awaitable[Any]]
+):
+    """
+    Run `handler` at most once per (scope, key).
+
+    Replays get the stored response (or client error) immediately, and
+    duplicates arriving while the original is in flight wait for it. Server
+    errors are not stored, so the client can retry them.
+    """
+    if not key:
+        return await handler()
+
+    store_key = f"{scope}:{key}"
+    fingerprint = request_fingerprint(payload)
+
+    while True:
+        entry, owner = store.begin(store_key, fingerprint)
+        if owner:
+            break
+
+        if entry.fingerprint != fingerprint:
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency-Key was already used with a different request"
+            )
+
+        try:
+            await asyncio.wait_for(entry.done.wait(), settings.idempotency_wait_timeout_seconds)
+        except asyncio.TimeoutError:
+            raise HTTPException(
+                status_code=409,
+                detail="A request with this Idempotency-Key is still in progress"
+            )
+
+        if entry.expires_at is not None:
+            if entry.error is not None:
+                raise entry.error
+            return entry.result
+        # The original failed and was released: run it ourselves
+
+    try:
+        result = await handler()
+    except HTTPException as e:
+        if e.status_code < 500:
+            store.complete(entry, error=e)
+        else:
+            store.release(store_key, entry)
+        raise
+    except BaseException:
+        store.release(store_key, entry)
+        raise
+
+    store.complete(entry, result=result)
+    return result
+
+
+# Shared store instance
+idempotency_store = IdempotencyStore(
+    max_entries=settings.idempotency_max_entries,
+    ttl_seconds=settings.idempotency_ttl_seconds
+)
@@ -1,15 +1,25 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, File, Header, UploadFile, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 from typing import Optional, List
+import io
+import threading
 from datetime import datetime
 import uuid
 from sqlalchemy.orm import Session
 
 from config import get_settings
-from database import get_db, ChatSession, ChatMessage
+from database import get_db, get_read_db, replica_router, ChatSession, ChatMessage
 from agent import AppointmentAgent, ConversationManager
 from services import AppointmentService
+from schedule_cache import start_schedule_listener
+from maintenance import start_maintenance_runner
+from outbox import start_outbox_dispatchers
+from idempotency import idempotency_store, run_idempotent
+from profiling import TokenCounter, TurnProfiler, build_profile_report
+import bulk
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -30,22 +40,56 @@ app.add_middleware(
 # Get settings
 settings = get_settings()
 
+# Upper bound for /availability/range requests
+MAX_AVAILABILITY_RANGE_DAYS = 366
+
 # Initialize agent (singleton)
 agent_executor = None
+token_counter = None
+agent_lock = threading.Lock()
 
 
 def get_agent():
-    """Get or create agent instance."""
-    global agent_executor
-    if agent_executor is None:
-        agent = AppointmentAgent(
-            openai_api_key=settings.openai_api_key,
-            model_name=settings.openai_model
-        )
-        agent_executor = agent.create_agent_executor()
+    """Get or create agent instance (blocking on first use: run it off the event loop)."""
+    global agent_executor, token_counter
+    with agent_lock:
+        if agent_executor is None:
+            agent = AppointmentAgent(
+                openai_api_key=settings.openai_api_key,
+                model_name=settings.openai_model
+            )
+            counter = TokenCounter(agent.llm)
+            # Fetch the tokenizer here rather than in a profiler callback,
+            # which runs on the event loop
+            counter.prime()
+            token_counter = counter
+            agent_executor = agent.create_agent_executor(verbose=settings.debug)
     return agent_executor
 
 
+# Background workers
+schedule_listener = None
+maintenance_runner = None
+outbox_dispatchers = []
+
+
+@app.on_event("startup")
+def start_background_workers():
+    """Start background workers (schedule cache, maintenance jobs, notification outbox)."""
+    global schedule_listener, maintenance_runner, outbox_dispatchers
+    schedule_listener = start_schedule_listener()
+    maintenance_runner = start_maintenance_runner()
+    outbox_dispatchers = start_outbox_dispatchers()
+
+
+@app.on_event("shutdown")
+def stop_background_workers():
+    """Stop background workers."""
+    for worker in (schedule_listener, maintenance_runner, *outbox_dispatchers):
+        if worker is not None:
+            worker.stop()
+
+
 # Pydantic models
 class ChatRequest(BaseModel):
     user_id: str = Field(..., description="User ID")
@@ -68,6 +112,17 @@ class AvailabilityResponse(BaseModel):
     available_slots: List[dict]
 
 
+class AvailabilityRangeRequest(BaseModel):
+    start_date: str = Field(..., description="First date in YYYY-MM-DD format")
+    end_date: str = Field(..., description="Last date (inclusive) in YYYY-MM-DD format")
+
+
+class AvailabilityRangeResponse(BaseModel):
+    start_date: str
+    end_date: str
+    days: List[dict]
+
+
 class AppointmentRequest(BaseModel):
     user_id: str
     date: str
@@ -104,18 +159,53 @@ async def health_check():
         "status": "healthy",
         "timestamp": datetime.utcnow().isoformat(),
         "database": "connected",
+        "replicas": replica_router.status(),
         "openai": "configured" if settings.openai_api_key else "not configured"
     }
 
 
+@app.get("/maintenance/jobs")
+async def get_maintenance_jobs():
+    """Runtime statistics of background maintenance jobs in this worker."""
+    if maintenance_runner is None:
+        return {"enabled": False, "jobs": {}}
+    
+    return {"enabled": True, "jobs": maintenance_runner.report()}
+
+
+@app.get("/agent/profile/report")
+async def get_agent_profile_report(
+    hours: int = 24,
+    top: int = 10,
+    db: Session = Depends(get_read_db)
+):
+    """Aggregate per-turn agent profiles: iterations, tokens, latency, tool usage."""
+    return build_profile_report(db, hours=hours, top=top)
+
+
 @app.post("/chat", response_model=ChatResponse)
 async def chat(
     request: ChatRequest,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     """
     Main chat endpoint. Processes user messages through LangChain agent.
+    
+    Retries with the same Idempotency-Key header replay the original response
+    instead of running the agent again.
     """
+    return await run_idempotent(
+        idempotency_store,
+        idempotency_key,
+        f"chat:{request.user_id}",
+        request.model_dump(),
+        lambda: process_chat(request, db)
+    )
+
+
+async def process_chat(request: ChatRequest, db: Session) -> ChatResponse:
+    """Run one chat turn through the agent and persist both messages."""
     try:
         user_id = uuid.UUID(request.user_id)
         session_id = uuid.UUID(request.session_id) if request.session_id else uuid.uuid4()
@@ -133,6 +223,11 @@ async def chat(
             )
             db.add(session)
             db.commit()
+        elif not session.is_active:
+            # Ended (idle expiry or explicitly) but the user is posting again: resume it
+            session.is_active = True
+            session.ended_at = None
+            db.commit()
         
         # Initialize conversation manager
         conv_manager = ConversationManager(db, user_id, session_id)
@@ -141,12 +236,18 @@ async def chat(
         conv_manager.add_message('user', request.message)
         
         # Get agent and process message
-        agent = get_agent()
+        agent = await run_in_threadpool(get_agent)
+        profiler = TurnProfiler(
+            request.message,
+            max_iterations=agent.max_iterations,
+            token_counter=token_counter
+        )
         
         try:
-            result = agent.invoke({
-                "input": request.message
-            })
+            result = await agent.ainvoke(
+                {"input": request.message},
+                config={"callbacks": [profiler]}
+            )
             
             response_text = result.get('output', 'I apologize, but I encountered an issue. Could you please rephrase your request?')
         
@@ -154,8 +255,15 @@ async def chat(
             print(f"Agent error: {e}")
             response_text = "I apologize for the inconvenience. I'm having trouble processing your request. Could you please try again or rephrase your question?"
         
-        # Save assistant response
-        conv_manager.add_message('assistant', response_text)
+        # Save assistant response with the turn profile
+        profile = profiler.profile()
+        conv_manager.add_message(
+            'assistant',
+            response_text,
+            metadata={'profile': profile},
+            token_count=profile['total_tokens']
+        )
+        replica_router.note_write(request.user_id, str(session_id))
         
         return ChatResponse(
             response=response_text,
@@ -175,7 +283,7 @@ async def chat(
 async def get_chat_history(
     session_id: str,
     limit: int = 50,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get chat history for a session."""
     try:
@@ -205,7 +313,7 @@ async def get_chat_history(
 @app.post("/availability", response_model=AvailabilityResponse)
 async def check_availability(
     request: AvailabilityRequest,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Check available appointment slots for a specific date."""
     try:
@@ -229,12 +337,58 @@ async def check_availability(
         raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
 
 
+@app.post("/availability/range", response_model=AvailabilityRangeResponse)
+async def check_availability_range(
+    request: AvailabilityRangeRequest,
+    db: Session = Depends(get_read_db)
+):
+    """Get per-day free slot counts for a date range (e.g. a month view)."""
+    try:
+        start_date = datetime.strptime(request.start_date, "%Y-%m-%d").date()
+        end_date = datetime.strptime(request.end_date, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+    
+    if end_date < start_date:
+        raise HTTPException(status_code=400, detail="end_date must not be before start_date")
+    
+    if (end_date - start_date).days >= MAX_AVAILABILITY_RANGE_DAYS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Date range cannot exceed {MAX_AVAILABILITY_RANGE_DAYS} days"
+        )
+    
+    days = AppointmentService.get_availability_range(db, start_date, end_date)
+    
+    return AvailabilityRangeResponse(
+        start_date=request.start_date,
+        end_date=request.end_date,
+        days=days
+    )
+
+
 @app.post("/appointments", response_model=AppointmentResponse)
 async def create_appointment(
     request: AppointmentRequest,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
-    """Create a new appointment."""
+    """
+    Create a new appointment.
+    
+    Retries with the same Idempotency-Key header return the original booking.
+    """
+    return await run_idempotent(
+        idempotency_store,
+        idempotency_key,
+        f"appointments:{request.user_id}",
+        request.model_dump(),
+        lambda: book_appointment(request, db)
+    )
+
+
+async def book_appointment(request: AppointmentRequest, db: Session) -> AppointmentResponse:
+    """Check availability and book the requested slot."""
     try:
         user_id = uuid.UUID(request.user_id)
         appointment_datetime = datetime.strptime(f"{request.date} {request.time}", "%Y-%m-%d %H:%M")
@@ -252,6 +406,7 @@ async def create_appointment(
             service_type=request.service_type,
             notes=request.notes
         )
+        replica_router.note_write(request.user_id)
         
         return AppointmentResponse(
             id=str(appointment.id),
@@ -271,7 +426,7 @@ async def create_appointment(
 async def get_user_appointments(
     user_id: str,
     include_past: bool = False,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get all appointments for a user."""
     try:
@@ -313,6 +468,8 @@ async def cancel_appointment(
         if not appointment:
             raise HTTPException(status_code=404, detail="Appointment not found")
         
+        replica_router.note_write(user_id)
+        
         return {
             "message": "Appointment cancelled successfully",
             "appointment_id": appointment_id
@@ -322,6 +479,51 @@ async def cancel_appointment(
         raise HTTPException(status_code=400, detail="Invalid ID format")
 
 
+@app.post("/bulk/appointments/import")
+async def import_appointments(
+    file: UploadFile = File(...),
+    format: str = "csv",
+    dry_run: bool = False,
+    on_conflict: str = "skip"
+):
+    """
+    Bulk import appointments from a CSV or NDJSON upload via COPY.
+    
+    Returns a report of imported and rejected rows (invalid, unknown user,
+    duplicate ID, schedule conflict).
+    """
+    source = io.TextIOWrapper(file.file, encoding="utf-8", newline="")
+    try:
+        return await run_in_threadpool(
+            bulk.import_appointments, source, format, dry_run, on_conflict
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid import: {str(e)}")
+
+
+@app.get("/bulk/{table}/export")
+async def export_table(
+    table: str,
+    format: str = "csv",
+    start: Optional[str] = None,
+    end: Optional[str] = None
+):
+    """
+    Stream `appointments` (filtered by date) or `chat_messages` (filtered by
+    timestamp) as CSV or NDJSON via COPY.
+    """
+    try:
+        chunks = bulk.export_stream(table, format, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return StreamingResponse(
+        chunks,
+        media_type=bulk.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{table}.{format}"'}
+    )
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
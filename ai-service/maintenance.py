@@ -0,0 +1,183 @@
+import threading
+import time
+import zlib
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from config import get_settings
+from database import engine
+
+settings = get_settings()
+
+
+class PeriodicJob:
+    """A maintenance job run every `interval_seconds` by at most one worker at a time."""
+
+    def __init__(self, name: str, interval_seconds: float, func: Callable[[Connection], int]):
+        self.name = name
+        self.interval_seconds = interval_seconds
+        self.func = func
+        # Advisory lock key shared by every worker running this job
+        self.lock_key = zlib.crc32(f"maintenance:{name}".encode())
+        self.next_run = time.monotonic()
+        self.stats = {
+            'runs': 0,
+            'skipped': 0,
+            'failures': 0,
+            'last_run_at': None,
+            'last_duration_ms': None,
+            'last_rows': None,
+            'total_rows': 0,
+            'last_error': None
+        }
+
+
+class JobRunner(threading.Thread):
+    """Background thread that runs periodic maintenance jobs."""
+
+    def __init__(self, jobs: List[PeriodicJob]):
+        super().__init__(name="maintenance-runner", daemon=True)
+        self.jobs = jobs
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        """Signal the runner to exit."""
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            now = time.monotonic()
+            for job in self.jobs:
+                if job.next_run <= now:
+                    self.run_job(job)
+                    job.next_run = time.monotonic() + job.interval_seconds
+
+            next_due = min(job.next_run for job in self.jobs)
+            self._stop_event.wait(max(0.0, next_due - time.monotonic()))
+
+    def run_job(self, job: PeriodicJob):
+        """Run a job once if no other worker holds its lock."""
+        try:
+            with engine.connect() as conn:
+                acquired = conn.execute(
+                    text("SELECT pg_try_advisory_lock(:key)"), {"key": job.lock_key}
+                ).scalar()
+                conn.commit()
+
+                if not acquired:
+                    job.stats['skipped'] += 1
+                    return
+
+                try:
+                    started = time.perf_counter()
+                    rows = job.func(conn)
+                    duration_ms = (time.perf_counter() - started) * 1000
+                finally:
+                    conn.rollback()
+                    conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": job.lock_key})
+                    conn.commit()
+
+            job.stats['runs'] += 1
+            job.stats['last_run_at'] = datetime.utcnow().isoformat()
+            job.stats['last_duration_ms'] = round(duration_ms, 2)
+            job.stats['last_rows'] = rows
+            job.stats['total_rows'] += rows
+            job.stats['last_error'] = None
+            print(f"Maintenance job {job.name}: {rows} rows in {duration_ms:.1f} ms")
+
+        except Exception as e:
+            job.stats['failures'] += 1
+            job.stats['last_error'] = str(e)
+            print(f"Maintenance job {job.name} error: {e}")
+
+    def report(self) -> Dict[str, Dict]:
+        """Get runtime statistics for every job."""
+        return {
+            job.name: dict(job.stats, interval_seconds=job.interval_seconds)
+            for job in self.jobs
+        }
+
+
+def _run_batched(conn: Connection, statement, params: Dict) -> int:
+    """Run a batched UPDATE until it touches fewer rows than the batch size."""
+    total = 0
+    while True:
+        result = conn.execute(statement, dict(params, batch_size=settings.maintenance_batch_size))
+        conn.commit()
+        total += result.rowcount
+        if result.rowcount < settings.maintenance_batch_size:
+            return total
+
+
+# Session and message timestamps are written as naive UTC (datetime.utcnow)
+EXPIRE_IDLE_SESSIONS = text("""
+    WITH idle AS (
+        SELECT s.id
+        FROM chat_sessions s
+        WHERE s.is_active
+            AND s.started_at < (now() AT TIME ZONE 'utc') - make_interval(mins => :timeout_minutes)
+            AND NOT EXISTS (
+                SELECT 1 FROM chat_messages m
+                WHERE m.session_id = s.id
+                    AND m.created_at >= (now() AT TIME ZONE 'utc') - make_interval(mins => :timeout_minutes)
+            )
+        LIMIT :batch_size
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE chat_sessions s
+    SET is_active = FALSE,
+        ended_at = COALESCE(
+            (SELECT MAX(m.created_at) FROM chat_messages m WHERE m.session_id = s.id),
+            s.started_at
+        )
+    FROM idle
+    WHERE s.id = idle.id
+""")
+
+
+TRANSITION_PAST_APPOINTMENTS = text("""
+    WITH past AS (
+        SELECT a.id
+        FROM appointments a
+        WHERE a.status IN ('scheduled', 'confirmed')
+            AND a.appointment_date <= CAST(LOCALTIMESTAMP - make_interval(mins => :grace_minutes) AS DATE)
+            AND a.appointment_date + a.end_time < LOCALTIMESTAMP - make_interval(mins => :grace_minutes)
+        LIMIT :batch_size
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE appointments a
+    SET status = CASE WHEN a.status = 'confirmed' THEN 'completed' ELSE :unconfirmed_status END
+    FROM past
+    WHERE a.id = past.id
+""")
+
+
+def expire_idle_sessions(conn: Connection) -> int:
+    """Deactivate chat sessions idle for longer than the session timeout."""
+    return _run_batched(conn, EXPIRE_IDLE_SESSIONS, {
+        "timeout_minutes": settings.session_timeout_minutes
+    })
+
+
+def transition_past_appointments(conn: Connection) -> int:
+    """Move ended appointments to 'completed' (unconfirmed ones to the configured final status)."""
+    return _run_batched(conn, TRANSITION_PAST_APPOINTMENTS, {
+        "grace_minutes": settings.appointment_completion_grace_minutes,
+        "unconfirmed_status": settings.unconfirmed_appointment_final_status
+    })
+
+
+def start_maintenance_runner() -> Optional[JobRunner]:
+    """Start the maintenance job runner if enabled in settings."""
+    if not settings.maintenance_enabled:
+        return None
+
+    runner = JobRunner([
+        PeriodicJob("expire_idle_sessions", settings.session_expiry_interval_seconds, expire_idle_sessions),
+        PeriodicJob("transition_past_appointments", settings.appointment_transition_interval_seconds, transition_past_appointments),
+    ])
+    runner.start()
+    return runner
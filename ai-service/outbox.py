@@ -0,0 +1,217 @@
+import json
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from config import get_settings
+from database import Appointment, OutboxMessage, engine
+
+settings = get_settings()
+
+
+def _appointment_payload(appointment: Appointment) -> Dict:
+    return {
+        'appointment_id': str(appointment.id),
+        'date': appointment.appointment_date.strftime('%Y-%m-%d'),
+        'time': appointment.appointment_time.strftime('%H:%M'),
+        'service_type': appointment.service_type
+    }
+
+
+def queue_booking_notifications(db: Session, appointment: Appointment):
+    """Queue confirmation and reminder messages; caller commits with the booking."""
+    payload = _appointment_payload(appointment)
+
+    db.add(OutboxMessage(
+        event_type='appointment_confirmation',
+        appointment_id=appointment.id,
+        user_id=appointment.user_id,
+        payload=payload
+    ))
+
+    remind_at = appointment.appointment_time - timedelta(hours=settings.reminder_lead_hours)
+    if remind_at > datetime.now():
+        db.add(OutboxMessage(
+            event_type='appointment_reminder',
+            appointment_id=appointment.id,
+            user_id=appointment.user_id,
+            payload=payload,
+            available_at=remind_at
+        ))
+
+
+def queue_cancellation_notifications(db: Session, appointment: Appointment):
+    """Drop pending reminders and queue a cancellation notice; caller commits."""
+    db.query(OutboxMessage).filter(
+        OutboxMessage.appointment_id == appointment.id,
+        OutboxMessage.event_type == 'appointment_reminder',
+        OutboxMessage.status == 'pending'
+    ).update({'status': 'cancelled'}, synchronize_session=False)
+
+    db.add(OutboxMessage(
+        event_type='appointment_cancellation',
+        appointment_id=appointment.id,
+        user_id=appointment.user_id,
+        payload=_appointment_payload(appointment)
+    ))
+
+
+# Notification sinks
+class NotificationSink(ABC):
+    """Delivers a single notification; raises on failure so it is retried."""
+
+    @abstractmethod
+    def send(self, message: Dict):
+        """Send one notification."""
+
+
+class LogSink(NotificationSink):
+    """Prints notifications to stdout (development)."""
+
+    def send(self, message: Dict):
+        print(f"Notification {message['event_type']} to {message['email']}: {json.dumps(message['payload'])}")
+
+
+class FileSink(NotificationSink):
+    """Appends notifications as NDJSON lines to a local file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, message: Dict):
+        with self._lock, open(self.path, 'a') as f:
+            f.write(json.dumps(message, default=str) + "\n")
+
+
+def create_sink(name: str) -> NotificationSink:
+    """Create a notification sink by name."""
+    if name == 'log':
+        return LogSink()
+    if name == 'file':
+        return FileSink(settings.notification_sink_path)
+    raise ValueError(f"Unknown notification sink: {name}")
+
+
+CLAIM_BATCH = text("""
+    WITH batch AS (
+        SELECT id
+        FROM notification_outbox
+        WHERE status = 'pending' AND available_at <= LOCALTIMESTAMP
+        ORDER BY available_at
+        LIMIT :batch_size
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE notification_outbox o
+    SET attempts = o.attempts + 1,
+        available_at = LOCALTIMESTAMP + make_interval(secs => :lease_seconds)
+    FROM batch, users u
+    WHERE o.id = batch.id AND u.id = o.user_id
+    RETURNING o.id, o.event_type, o.payload, o.attempts, u.email, u.full_name
+""")
+
+MARK_SENT = text("""
+    UPDATE notification_outbox
+    SET status = 'sent', sent_at = LOCALTIMESTAMP, last_error = NULL
+    WHERE id = ANY(CAST(:ids AS uuid[]))
+""")
+
+MARK_FAILED = text("""
+    UPDATE notification_outbox
+    SET status = CASE WHEN attempts >= :max_attempts THEN 'failed' ELSE 'pending' END,
+        available_at = LOCALTIMESTAMP + make_interval(secs => :delay_seconds),
+        last_error = :error
+    WHERE id = :id
+""")
+
+
+class OutboxDispatcher(threading.Thread):
+    """
+    Background worker that delivers outbox rows in batches.
+
+    Rows are claimed with SKIP LOCKED and leased by pushing `available_at`
+    forward, so any number of workers (threads or processes) can run
+    side by side, and rows held by a crashed worker are retried after the lease.
+    """
+
+    def __init__(self, sink: NotificationSink, name: str = "outbox-dispatcher"):
+        super().__init__(name=name, daemon=True)
+        self.sink = sink
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        """Signal the dispatcher to exit."""
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                claimed = self.dispatch_batch()
+            except Exception as e:
+                print(f"Outbox dispatcher error: {e}")
+                claimed = 0
+
+            # Keep draining while batches come back full
+            if claimed < settings.outbox_batch_size:
+                self._stop_event.wait(settings.outbox_poll_interval_seconds)
+
+    def dispatch_batch(self) -> int:
+        """Claim, send and settle one batch; returns the number of rows claimed."""
+        with engine.begin() as conn:
+            rows = conn.execute(CLAIM_BATCH, {
+                "batch_size": settings.outbox_batch_size,
+                "lease_seconds": settings.outbox_lease_seconds
+            }).mappings().all()
+
+        if not rows:
+            return 0
+
+        sent: List[str] = []
+        failed: List[Dict] = []
+        for row in rows:
+            try:
+                self.sink.send({
+                    'id': str(row['id']),
+                    'event_type': row['event_type'],
+                    'email': row['email'],
+                    'full_name': row['full_name'],
+                    'payload': row['payload']
+                })
+                sent.append(str(row['id']))
+            except Exception as e:
+                failed.append({
+                    "id": row['id'],
+                    "error": str(e),
+                    "max_attempts": settings.outbox_max_attempts,
+                    "delay_seconds": min(
+                        settings.outbox_backoff_seconds * 2 ** (row['attempts'] - 1),
+                        settings.outbox_max_backoff_seconds
+                    )
+                })
+
+        with engine.begin() as conn:
+            if sent:
+                conn.execute(MARK_SENT, {"ids": sent})
+            if failed:
+                conn.execute(MARK_FAILED, failed)
+
+        return len(rows)
+
+
+def start_outbox_dispatchers() -> List[OutboxDispatcher]:
+    """Start outbox dispatcher workers if enabled in settings."""
+    if not settings.outbox_dispatcher_enabled:
+        return []
+
+    sink = create_sink(settings.notification_sink)
+    dispatchers = [
+        OutboxDispatcher(sink, name=f"outbox-dispatcher-{n}")
+        for n in range(settings.outbox_dispatcher_workers)
+    ]
+    for dispatcher in dispatchers:
+        dispatcher.start()
+    return dispatchers
@@ -0,0 +1,323 @@
+import json
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from langchain.callbacks.base import BaseCallbackHandler
+from langchain.schema import BaseMessage, HumanMessage
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+# Max characters of tool input/output and user input kept in a profile
+PREVIEW_CHARS = 500
+
+
+def _preview(value: Any) -> str:
+    value = str(value)
+    return value if len(value) <= PREVIEW_CHARS else value[:PREVIEW_CHARS] + "..."
+
+
+# Rough characters-per-token ratio used when no tokenizer is available
+CHARS_PER_TOKEN = 4
+
+
+def _message_text(message: BaseMessage) -> str:
+    """Text the model reads or writes for a message, including tool/function calls."""
+    parts = [message.content if isinstance(message.content, str) else json.dumps(message.content)]
+    for call in message.additional_kwargs.get('tool_calls') or []:
+        function = call.get('function') or {}
+        parts.append(function.get('name') or '')
+        parts.append(function.get('arguments') or '')
+    function_call = message.additional_kwargs.get('function_call')
+    if function_call:
+        parts.append(function_call.get('name') or '')
+        parts.append(function_call.get('arguments') or '')
+    return ''.join(parts)
+
+
+class TokenCounter:
+    """
+    Counts prompt and completion tokens with the chat model's tokenizer.
+
+    The agent calls the model through `stream`/`astream`, which reports no
+    token usage, so turns are counted locally. If the tokenizer is unavailable
+    (unknown model, or the tiktoken encoding cannot be fetched) counting falls
+    back to a characters-per-token estimate for the rest of the process.
+
+    Tool/function schemas sent with each call are billed as prompt tokens;
+    they are counted from their JSON form (an approximation of OpenAI's
+    internal rendering) and cached, since the agent sends the same ones
+    every time.
+    """
+
+    def __init__(self, llm):
+        self.llm = llm
+        self.exact = True
+        self._schema_tokens: Dict[str, int] = {}
+
+    def _disable(self, error: Exception):
+        print(f"Token counting falls back to estimates: {error}")
+        self.exact = False
+
+    def prime(self):
+        """Load the tokenizer now (tiktoken may download its encoding on first use)."""
+        self.count_prompt([HumanMessage(content="")])
+
+    def count_schemas(self, invocation_params: Dict) -> int:
+        schemas = invocation_params.get('tools') or invocation_params.get('functions')
+        if not schemas:
+            return 0
+        text = json.dumps(schemas, sort_keys=True)
+        if text not in self._schema_tokens:
+            self._schema_tokens[text] = self._count_text(text)
+        return self._schema_tokens[text]
+
+    def count_prompt(self, messages: List[BaseMessage]) -> int:
+        if self.exact:
+            try:
+                return self.llm.get_num_tokens_from_messages(messages)
+            except Exception as e:
+                self._disable(e)
+        return sum(len(_message_text(message)) // CHARS_PER_TOKEN + 3 for message in messages) + 3
+
+    def count_completion(self, message: BaseMessage) -> int:
+        return self._count_text(_message_text(message))
+
+    def _count_text(self, text: str) -> int:
+        if self.exact:
+            try:
+                return self.llm.get_num_tokens(text)
+            except Exception as e:
+                self._disable(e)
+        return len(text) // CHARS_PER_TOKEN
+
+
+class TurnProfiler(BaseCallbackHandler):
+    """
+    Callback handler that profiles a single agent turn.
+
+    Records every LLM call (latency, token usage) and tool call (input,
+    output, latency) in order; `profile()` returns the summary stored in
+    `chat_messages.metadata`. Token usage reported by the API is used when
+    present, otherwise tokens are counted with `token_counter`.
+    """
+
+    # Run on the event loop rather than a worker thread; handlers only do bookkeeping
+    run_inline = True
+
+    def __init__(
+        self,
+        user_input: str,
+        max_iterations: Optional[int] = None,
+        token_counter: Optional[TokenCounter] = None
+    ):
+        self.user_input = user_input
+        self.max_iterations = max_iterations
+        self.token_counter = token_counter
+        self.steps: List[Dict] = []
+        self._started: Dict[UUID, float] = {}
+        self._prompt_tokens: Dict[UUID, int] = {}
+        self._tool_names: Dict[UUID, str] = {}
+        self._tool_inputs: Dict[UUID, str] = {}
+        self._turn_started = time.perf_counter()
+
+    def _counted_source(self) -> Optional[str]:
+        if self.token_counter is None:
+            return None
+        return 'counted' if self.token_counter.exact else 'estimated'
+
+    def _elapsed_ms(self, run_id: UUID) -> Optional[float]:
+        started = self._started.pop(run_id, None)
+        return None if started is None else round((time.perf_counter() - started) * 1000, 2)
+
+    # LLM calls
+    def on_llm_start(self, serialized: Dict, prompts: List[str], *, run_id: UUID, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_chat_model_start(self, serialized: Dict, messages: List, *, run_id: UUID, **kwargs):
+        self._started[run_id] = time.perf_counter()
+        if self.token_counter:
+            # Every prompt in the batch is sent with the tool schemas
+            schema_tokens = self.token_counter.count_schemas(kwargs.get('invocation_params') or {})
+            self._prompt_tokens[run_id] = sum(
+                self.token_counter.count_prompt(batch) + schema_tokens for batch in messages
+            )
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs):
+        usage = (response.llm_output or {}).get('token_usage') or {}
+        prompt_tokens = self._prompt_tokens.pop(run_id, 0)
+
+        if usage:
+            prompt_tokens = usage.get('prompt_tokens', 0)
+            completion_tokens = usage.get('completion_tokens', 0)
+            source = 'reported'
+        elif self.token_counter:
+            completion_tokens = sum(
+                self.token_counter.count_completion(generation.message)
+                for generations in response.generations
+                for generation in generations
+                if hasattr(generation, 'message')
+            )
+            source = self._counted_source()
+        else:
+            completion_tokens = 0
+            source = None
+
+        self.steps.append({
+            'type': 'llm',
+            'latency_ms': self._elapsed_ms(run_id),
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'token_source': source
+        })
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs):
+        self.steps.append({
+            'type': 'llm',
+            'latency_ms': self._elapsed_ms(run_id),
+            'prompt_tokens': self._prompt_tokens.pop(run_id, 0),
+            'completion_tokens': 0,
+            'token_source': self._counted_source(),
+            'error': _preview(error)
+        })
+
+    # Tool calls
+    def on_tool_start(self, serialized: Dict, input_str: str, *, run_id: UUID, **kwargs):
+        self._started[run_id] = time.perf_counter()
+        self._tool_names[run_id] = (serialized or {}).get('name', 'unknown')
+        self._tool_inputs[run_id] = _preview(input_str)
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs):
+        self.steps.append({
+            'type': 'tool',
+            'tool': self._tool_names.pop(run_id, 'unknown'),
+            'input': self._tool_inputs.pop(run_id, ''),
+            'output': _preview(output),
+            'latency_ms': self._elapsed_ms(run_id)
+        })
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs):
+        self.steps.append({
+            'type': 'tool',
+            'tool': self._tool_names.pop(run_id, 'unknown'),
+            'input': self._tool_inputs.pop(run_id, ''),
+            'error': _preview(error),
+            'latency_ms': self._elapsed_ms(run_id)
+        })
+
+    def profile(self) -> Dict:
+        """Summarize the turn."""
+        llm_steps = [step for step in self.steps if step['type'] == 'llm']
+        prompt_tokens = sum(step['prompt_tokens'] for step in llm_steps)
+        completion_tokens = sum(step['completion_tokens'] for step in llm_steps)
+
+        return {
+            'input_preview': _preview(self.user_input),
+            'iterations': len(llm_steps),
+            'tool_calls': len(self.steps) - len(llm_steps),
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+            'tokens_estimated': any(step['token_source'] == 'estimated' for step in llm_steps),
+            'total_latency_ms': round((time.perf_counter() - self._turn_started) * 1000, 2),
+            'hit_max_iterations': (
+                self.max_iterations is not None and len(llm_steps) >= self.max_iterations
+            ),
+            'steps': self.steps
+        }
+
+
+PROFILE_SUMMARY = text("""
+    SELECT
+        COUNT(*) AS turns,
+        AVG((metadata->'profile'->>'iterations')::int) AS avg_iterations,
+        percentile_cont(0.95) WITHIN GROUP (
+            ORDER BY (metadata->'profile'->>'iterations')::int
+        ) AS p95_iterations,
+        AVG((metadata->'profile'->>'tool_calls')::int) AS avg_tool_calls,
+        SUM((metadata->'profile'->>'prompt_tokens')::int) AS prompt_tokens,
+        SUM((metadata->'profile'->>'completion_tokens')::int) AS completion_tokens,
+        AVG(token_count) AS avg_tokens_per_turn,
+        AVG((metadata->'profile'->>'total_latency_ms')::float) AS avg_latency_ms,
+        percentile_cont(0.95) WITHIN GROUP (
+            ORDER BY (metadata->'profile'->>'total_latency_ms')::float
+        ) AS p95_latency_ms,
+        COUNT(*) FILTER (
+            WHERE (metadata->'profile'->>'hit_max_iterations')::boolean
+        ) AS max_iteration_turns
+    FROM chat_messages
+    WHERE message_type = 'assistant'
+        AND created_at >= :since
+        AND metadata->'profile' IS NOT NULL
+""")
+
+PROFILE_TOOLS = text("""
+    SELECT
+        step->>'tool' AS tool,
+        COUNT(*) AS calls,
+        COUNT(*) FILTER (WHERE step->'error' IS NOT NULL) AS errors,
+        AVG((step->>'latency_ms')::float) AS avg_latency_ms
+    FROM chat_messages,
+        jsonb_array_elements(metadata->'profile'->'steps') AS step
+    WHERE message_type = 'assistant'
+        AND created_at >= :since
+        AND step->>'type' = 'tool'
+    GROUP BY step->>'tool'
+    ORDER BY calls DESC
+""")
+
+PROFILE_TOP_TURNS = text("""
+    SELECT
+        id,
+        session_id,
+        created_at,
+        metadata->'profile'->>'input_preview' AS input_preview,
+        (metadata->'profile'->>'iterations')::int AS iterations,
+        token_count
+    FROM chat_messages
+    WHERE message_type = 'assistant'
+        AND created_at >= :since
+        AND metadata->'profile' IS NOT NULL
+    ORDER BY iterations DESC, token_count DESC NULLS LAST
+    LIMIT :limit
+""")
+
+
+def _number(value) -> Optional[float]:
+    return None if value is None else round(float(value), 2)
+
+
+def build_profile_report(db: Session, hours: int = 24, top: int = 10) -> Dict:
+    """Aggregate stored turn profiles over the last `hours`."""
+    since = datetime.utcnow() - timedelta(hours=hours)
+    params = {"since": since}
+
+    summary = db.execute(PROFILE_SUMMARY, params).mappings().one()
+    tools = db.execute(PROFILE_TOOLS, params).mappings().all()
+    top_turns = db.execute(PROFILE_TOP_TURNS, dict(params, limit=top)).mappings().all()
+
+    return {
+        "since": since.isoformat(),
+        "summary": {key: _number(value) for key, value in summary.items()},
+        "tools": [
+            {
+                "tool": row["tool"],
+                "calls": row["calls"],
+                "errors": row["errors"],
+                "avg_latency_ms": _number(row["avg_latency_ms"])
+            }
+            for row in tools
+        ],
+        "top_turns": [
+            {
+                "message_id": str(row["id"]),
+                "session_id": str(row["session_id"]),
+                "timestamp": row["created_at"].isoformat(),
+                "input_preview": row["input_preview"],
+                "iterations": row["iterations"],
+                "token_count": row["token_count"]
+            }
+            for row in top_turns
+        ]
+    }
@@ -0,0 +1,303 @@
+import json
+import select
+import threading
+import time
+from datetime import date, datetime, time as dt_time, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import psycopg2
+import psycopg2.extensions
+from sqlalchemy import and_
+from sqlalchemy.orm import Session
+
+from config import get_settings
+from database import Appointment, SessionLocal, engine
+
+settings = get_settings()
+
+# Channel the notify_schedule_change() trigger in database/schema.sql publishes on
+SCHEDULE_NOTIFY_CHANNEL = "schedule_changes"
+
+# Statuses that occupy a time slot
+ACTIVE_STATUSES = ('scheduled', 'confirmed')
+
+# Hourly slots during business hours: 9 AM to 5 PM
+SLOT_START_HOUR = 9
+SLOT_END_HOUR = 17
+SLOT_COUNT = SLOT_END_HOUR - SLOT_START_HOUR
+
+Interval = Tuple[dt_time, dt_time]
+
+
+def _as_time(value) -> dt_time:
+    """Normalize a TIME/TIMESTAMP column value to a time of day."""
+    return value.time() if isinstance(value, datetime) else value
+
+
+def as_date(value) -> date:
+    """Normalize a DATE/TIMESTAMP column value to a date."""
+    return value.date() if isinstance(value, datetime) else value
+
+
+def occupancy_bitmap(intervals) -> int:
+    """Encode booked intervals as a bitmap; bit i is the slot starting at SLOT_START_HOUR + i."""
+    bitmap = 0
+    for i in range(SLOT_COUNT):
+        slot_start = dt_time(SLOT_START_HOUR + i)
+        slot_end = dt_time(SLOT_START_HOUR + i + 1)
+        if any(start < slot_end and end > slot_start for start, end in intervals):
+            bitmap |= 1 << i
+    return bitmap
+
+
+class DaySchedule:
+    """Active bookings of a single day, keyed by appointment ID."""
+
+    __slots__ = ('loaded_at', 'bookings', 'bitmap')
+
+    def __init__(self, loaded_at: float, bookings: Dict[str, Interval]):
+        self.loaded_at = loaded_at
+        self.bookings = bookings
+        self.bitmap = occupancy_bitmap(bookings.values())
+
+    def refresh_bitmap(self):
+        self.bitmap = occupancy_bitmap(self.bookings.values())
+
+
+class ScheduleCache:
+    """
+    In-process cache of booked intervals and slot bitmaps per day.
+
+    Entries are only served while the NOTIFY listener is connected, so a long
+    TTL is safe: every committed change to `appointments` is patched into the
+    cached day, and `availability_slots` changes drop everything. Patches are
+    keyed by appointment ID, so applying one twice is harmless.
+    """
+
+    def __init__(self, ttl_seconds: int):
+        self.ttl_seconds = ttl_seconds
+        self._days: Dict[date, DaySchedule] = {}
+        self._lock = threading.Lock()
+        # Change counter; loads only store days untouched since they started
+        self._generation = 0
+        self._reset_at = 0
+        self._changed_at: Dict[date, int] = {}
+        self._listening = False
+
+    def set_listening(self, listening: bool):
+        """Enable or disable serving from cache; always drops cached state."""
+        with self._lock:
+            self._listening = listening
+            self._reset()
+
+    def invalidate(self, day: date):
+        """Drop cached state for a single day."""
+        with self._lock:
+            self._days.pop(day, None)
+            self._mark_changed(day)
+
+    def invalidate_all(self):
+        """Drop all cached state (full resync on next read)."""
+        with self._lock:
+            self._reset()
+
+    def put_booking(self, day: date, appointment_id: str, start: dt_time, end: dt_time):
+        """Record an active booking in a cached day."""
+        with self._lock:
+            entry = self._days.get(day)
+            if entry:
+                entry.bookings[appointment_id] = (start, end)
+                entry.refresh_bitmap()
+            self._mark_changed(day)
+
+    def remove_booking(self, day: date, appointment_id: str):
+        """Remove a booking from a cached day."""
+        with self._lock:
+            entry = self._days.get(day)
+            if entry and entry.bookings.pop(appointment_id, None):
+                entry.refresh_bitmap()
+            self._mark_changed(day)
+
+    def get_booked_intervals(self, db: Session, day: date) -> List[Interval]:
+        """Get (start, end) intervals of active appointments on a day."""
+        entry = self._get_days(db, day, day)[day]
+        return list(entry.bookings.values())
+
+    def get_day_occupancy(self, db: Session, start_date: date, end_date: date) -> Dict[date, int]:
+        """Get slot bitmaps for every day in [start_date, end_date]."""
+        return {
+            day: entry.bitmap
+            for day, entry in self._get_days(db, start_date, end_date).items()
+        }
+
+    def _get_days(self, db: Session, start_date: date, end_date: date) -> Dict[date, DaySchedule]:
+        """Serve days from cache, loading all missing ones with a single query."""
+        now = time.monotonic()
+        days = [start_date + timedelta(days=n) for n in range((end_date - start_date).days + 1)]
+        result = {}
+        missing = []
+
+        with self._lock:
+            for day in days:
+                entry = self._days.get(day)
+                if self._listening and entry and now - entry.loaded_at < self.ttl_seconds:
+                    result[day] = entry
+                else:
+                    missing.append(day)
+            generation = self._generation
+            listening = self._listening
+
+        if missing:
+            if listening:
+                # Cached days must come from the primary: a lagging replica could
+                # miss a change whose notification was already applied
+                with SessionLocal() as primary_db:
+                    loaded = self._load(primary_db, missing[0], missing[-1], now)
+            else:
+                loaded = self._load(db, missing[0], missing[-1], now)
+            with self._lock:
+                # Skip storing days that changed while we were reading
+                store = listening and self._listening and self._reset_at <= generation
+                for day in missing:
+                    result[day] = loaded[day]
+                    if store and self._changed_at.get(day, 0) <= generation:
+                        self._days[day] = loaded[day]
+
+        return result
+
+    def _mark_changed(self, day: date):
+        self._generation += 1
+        self._changed_at[day] = self._generation
+
+    def _reset(self):
+        self._days.clear()
+        self._changed_at.clear()
+        self._generation += 1
+        self._reset_at = self._generation
+
+    def _load(self, db: Session, start_date: date, end_date: date, now: float) -> Dict[date, DaySchedule]:
+        rows = db.query(
+            Appointment.id,
+            Appointment.appointment_date,
+            Appointment.appointment_time,
+            Appointment.end_time
+        ).filter(
+            and_(
+                Appointment.appointment_date >= start_date,
+                Appointment.appointment_date <= end_date,
+                Appointment.status.in_(ACTIVE_STATUSES)
+            )
+        ).all()
+
+        bookings: Dict[date, Dict[str, Interval]] = {}
+        for appointment_id, day, start, end in rows:
+            bookings.setdefault(as_date(day), {})[str(appointment_id)] = (_as_time(start), _as_time(end))
+
+        return {
+            start_date + timedelta(days=n): DaySchedule(now, bookings.get(start_date + timedelta(days=n), {}))
+            for n in range((end_date - start_date).days + 1)
+        }
+
+
+class ScheduleListener(threading.Thread):
+    """Background thread that applies NOTIFY events to a ScheduleCache."""
+
+    def __init__(
+        self,
+        cache: ScheduleCache,
+        channel: str = SCHEDULE_NOTIFY_CHANNEL,
+        poll_interval: float = 5.0,
+        reconnect_delay: float = 1.0,
+        max_reconnect_delay: float = 30.0
+    ):
+        super().__init__(name="schedule-listener", daemon=True)
+        self.cache = cache
+        self.channel = channel
+        self.poll_interval = poll_interval
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self._stop_event = threading.Event()
+        self._delay = reconnect_delay
+
+    def stop(self):
+        """Signal the listener to exit."""
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                self._listen()
+            except (psycopg2.Error, OSError) as e:
+                print(f"Schedule listener error: {e}")
+
+            self.cache.set_listening(False)
+            self._stop_event.wait(self._delay)
+            self._delay = min(self._delay * 2, self.max_reconnect_delay)
+
+    def _connect(self):
+        dsn = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        conn = psycopg2.connect(dsn)
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        return conn
+
+    def _listen(self):
+        conn = self._connect()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(f'LISTEN "{self.channel}"')
+
+            # Changes made while disconnected were missed: resync from scratch
+            self.cache.set_listening(True)
+            self._delay = self.reconnect_delay
+
+            while not self._stop_event.is_set():
+                if select.select([conn], [], [], self.poll_interval) == ([], [], []):
+                    # Idle: probe the connection so a dead socket is noticed.
+                    # Notifications received during the probe land in conn.notifies
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT 1")
+                else:
+                    conn.poll()
+
+                while conn.notifies:
+                    self._handle(conn.notifies.pop(0).payload)
+        finally:
+            self.cache.set_listening(False)
+            conn.close()
+
+    def _handle(self, payload: str):
+        """Apply a single notification payload to the cache."""
+        try:
+            event = json.loads(payload)
+            if event.get('table') != 'appointments' or event.get('op') == 'BULK':
+                # Slot definitions and bulk imports affect every day
+                self.cache.invalidate_all()
+                return
+
+            appointment_id = event['id']
+            old, new = event.get('old'), event.get('new')
+            if old:
+                self.cache.remove_booking(date.fromisoformat(old['date']), appointment_id)
+            if new and new['status'] in ACTIVE_STATUSES:
+                self.cache.put_booking(
+                    date.fromisoformat(new['date']),
+                    appointment_id,
+                    dt_time.fromisoformat(new['start']),
+                    dt_time.fromisoformat(new['end'])
+                )
+        except (ValueError, TypeError, KeyError, AttributeError):
+            self.cache.invalidate_all()
+
+
+# Shared cache instance
+schedule_cache = ScheduleCache(ttl_seconds=settings.schedule_cache_ttl_seconds)
+
+
+def start_schedule_listener() -> Optional[ScheduleListener]:
+    """Start the NOTIFY listener if enabled in settings."""
+    if not settings.schedule_listener_enabled:
+        return None
+
+    listener = ScheduleListener(schedule_cache)
+    listener.start()
+    return listener
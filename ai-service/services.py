@@ -1,8 +1,10 @@
-from datetime import datetime, timedelta
+from datetime import date as date_type, datetime, timedelta
 from typing import List, Dict, Optional
 from sqlalchemy.orm import Session
 from sqlalchemy import and_, or_
 from database import Appointment
+from outbox import queue_booking_notifications, queue_cancellation_notifications
+from schedule_cache import schedule_cache, as_date, ACTIVE_STATUSES, SLOT_START_HOUR, SLOT_END_HOUR, SLOT_COUNT
 import uuid
 
 
@@ -56,13 +58,17 @@ class AppointmentService:
         available_slots = []
         
         # Business hours: 9 AM to 5 PM
-        start_hour = 9
-        end_hour = 17
+        start_hour = SLOT_START_HOUR
+        end_hour = SLOT_END_HOUR
+        
+        # One cached lookup per day instead of one query per slot
+        booked = schedule_cache.get_booked_intervals(db, date.date())
         
         for hour in range(start_hour, end_hour):
             slot_time = datetime.combine(date.date(), datetime.min.time()).replace(hour=hour)
+            slot_end = (slot_time + timedelta(minutes=duration_minutes)).time()
             
-            if AppointmentService.check_availability(db, date, slot_time, duration_minutes):
+            if not any(start < slot_end and end > slot_time.time() for start, end in booked):
                 available_slots.append({
                     'time': slot_time.strftime('%I:%M %p'),
                     'datetime': slot_time.isoformat()
@@ -70,6 +76,34 @@ class AppointmentService:
         
         return available_slots
     
+    @staticmethod
+    def get_availability_range(
+        db: Session,
+        start_date: date_type,
+        end_date: date_type
+    ) -> List[Dict]:
+        """Get per-day free slot counts for a date range (calendar heatmap)."""
+        occupancy = schedule_cache.get_day_occupancy(db, start_date, end_date)
+        today = datetime.now().date()
+        days = []
+        
+        for day in sorted(occupancy):
+            bitmap = occupancy[day]
+            closed = day.weekday() >= 5
+            free_slots = 0 if closed else SLOT_COUNT - bin(bitmap).count('1')
+            
+            days.append({
+                'date': day.isoformat(),
+                'free_slots': free_slots,
+                'total_slots': 0 if closed else SLOT_COUNT,
+                'occupancy': bitmap,
+                'closed': closed,
+                'past': day < today,
+                'fully_booked': not closed and free_slots == 0
+            })
+        
+        return days
+    
     @staticmethod
     def create_appointment(
         db: Session,
@@ -94,9 +128,21 @@ class AppointmentService:
         )
         
         db.add(appointment)
+        db.flush()
+        
+        # Notifications are committed atomically with the booking
+        queue_booking_notifications(db, appointment)
         db.commit()
         db.refresh(appointment)
         
+        # Local read-your-writes; other processes are notified by the trigger
+        schedule_cache.put_booking(
+            appointment_date.date(),
+            str(appointment.id),
+            appointment_time.time(),
+            end_time.time()
+        )
+        
         return appointment
     
     @staticmethod
@@ -119,19 +165,24 @@ class AppointmentService:
         appointment_id: uuid.UUID,
         user_id: uuid.UUID
     ) -> Optional[Appointment]:
-        """Cancel an appointment."""
+        """Cancel an appointment; repeated calls leave it unchanged and notify only once."""
+        # Row lock so concurrent retries cannot both see an active status
         appointment = db.query(Appointment).filter(
             and_(
                 Appointment.id == appointment_id,
                 Appointment.user_id == user_id
             )
-        ).first()
+        ).with_for_update().first()
         
-        if appointment:
+        if appointment and appointment.status in ACTIVE_STATUSES:
             appointment.status = 'cancelled'
             appointment.cancelled_at = datetime.utcnow()
+            queue_cancellation_notifications(db, appointment)
             db.commit()
             db.refresh(appointment)
+            schedule_cache.remove_booking(as_date(appointment.appointment_date), str(appointment.id))
+        elif appointment:
+            db.rollback()  # release the row lock
         
         return appointment
     
@@ -157,5 +208,6 @@ class AppointmentService:
             
             db.commit()
             db.refresh(appointment)
+            schedule_cache.invalidate_all()
         
         return appointment
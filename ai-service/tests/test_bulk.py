@@ -0,0 +1,229 @@
+import csv
+import io
+import uuid
+
+import pytest
+
+import bulk
+from bulk import (
+    BulkInputError,
+    _ChunkReader,
+    _parse_appointment,
+    _read_records,
+    export_stream,
+    import_appointments,
+)
+
+USER_ID = '6f1c2b1e-8a57-4f1e-9d43-0f3c6f0e4a11'
+
+
+def record(**overrides):
+    values = {'user_id': USER_ID, 'appointment_date': '2024-03-18', 'appointment_time': '10:00'}
+    values.update(overrides)
+    return values
+
+
+# _parse_appointment
+def test_parse_fills_defaults():
+    row = _parse_appointment(record())
+    assert uuid.UUID(row[0])  # generated ID
+    assert row[1:] == [USER_ID, '2024-03-18', '10:00:00', '11:00:00', None, 'scheduled', None, None]
+
+
+def test_parse_keeps_given_values():
+    appointment_id = str(uuid.uuid4())
+    row = _parse_appointment(record(
+        id=appointment_id,
+        appointment_date='2024-03-18T00:00:00',
+        appointment_time='09:30:00',
+        end_time='10:15',
+        service_type='Initial Assessment',
+        status='confirmed',
+        notes='first visit',
+        created_at='2024-03-01T08:00:00'
+    ))
+    assert row == [
+        appointment_id, USER_ID, '2024-03-18', '09:30:00', '10:15:00',
+        'Initial Assessment', 'confirmed', 'first visit', '2024-03-01T08:00:00'
+    ]
+
+
+def test_parse_treats_empty_strings_as_missing():
+    row = _parse_appointment(record(id='', end_time='', status='', notes=''))
+    assert row[4] == '11:00:00'
+    assert row[6] == 'scheduled'
+    assert row[7] is None
+
+
+@pytest.mark.parametrize('overrides, message', [
+    ({'user_id': ''}, 'user_id is required'),
+    ({'appointment_time': None}, 'required'),
+    ({'user_id': 'not-a-uuid'}, 'badly formed'),
+    ({'appointment_date': '18/03/2024'}, 'does not match format'),
+    ({'appointment_time': '10am'}, 'does not match format'),
+    ({'end_time': '09:00'}, 'end_time must be after'),
+    ({'appointment_time': '23:30'}, 'same day'),
+    ({'status': 'pending'}, 'Invalid status'),
+    ({'service_type': 'x' * 256}, 'longer than 255'),
+    ({'notes': 'bad\x00byte'}, 'NUL'),
+    ({'service_type': '\x00'}, 'NUL'),
+])
+def test_parse_rejects_invalid_records(overrides, message):
+    with pytest.raises(ValueError, match=message):
+        _parse_appointment(record(**overrides))
+
+
+# _read_records
+def test_csv_records():
+    source = io.StringIO("user_id,appointment_date,appointment_time\nu,2024-03-18,10:00\n")
+    assert list(_read_records(source, 'csv')) == [
+        {'user_id': 'u', 'appointment_date': '2024-03-18', 'appointment_time': '10:00'}
+    ]
+
+
+def test_csv_without_header_is_rejected():
+    with pytest.raises(BulkInputError):
+        list(_read_records(io.StringIO(""), 'csv'))
+
+
+def test_ndjson_skips_blank_lines_and_yields_parse_errors():
+    source = io.StringIO('{"a": 1}\n\n{broken\n{"b": 2}\n')
+    records = list(_read_records(source, 'ndjson'))
+    assert records[0] == {'a': 1}
+    assert isinstance(records[1], ValueError)
+    assert records[2] == {'b': 2}
+
+
+def test_csv_missing_required_columns_is_rejected():
+    with pytest.raises(BulkInputError, match='appointment_time'):
+        _read_records(io.StringIO("user_id,appointment_date\n"), 'csv')
+
+
+def test_unknown_import_format_is_rejected():
+    with pytest.raises(BulkInputError):
+        list(_read_records(io.StringIO(""), 'xml'))
+
+
+# _ChunkReader
+def test_chunk_reader_reassembles_chunks():
+    reader = _ChunkReader(['ab', 'cde', '', 'f'])
+    assert reader.read(4) == 'abcd'
+    assert reader.read(10) == 'ef'
+    assert reader.read(10) == ''
+
+
+# export_stream validation (before any COPY runs)
+@pytest.mark.parametrize('args', [
+    ('users', 'csv', None, None),
+    ('appointments', 'xlsx', None, None),
+    ('appointments', 'csv', 'abc', None),
+    ('chat_messages', 'ndjson', None, '2024-13-01'),
+])
+def test_export_rejects_bad_arguments(args):
+    with pytest.raises(ValueError):
+        export_stream(*args)
+
+
+# import_appointments (COPY is drained by a fake connection)
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rowcount = 0
+
+    def execute(self, sql, params=None):
+        self.conn.statements.append(sql)
+
+    def fetchone(self):
+        return 0, None
+
+    def copy_expert(self, sql, source):
+        # Like psycopg2: pull until exhausted, replacing read() errors
+        data = []
+        try:
+            while True:
+                chunk = source.read(8192)
+                if not chunk:
+                    break
+                data.append(chunk)
+        except Exception as e:
+            raise RuntimeError(f"QueryCanceled: error in .read() call: {e}")
+        self.conn.staged = list(csv.reader(io.StringIO(''.join(data))))
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self):
+        self.statements = []
+        self.staged = None
+        self.committed = False
+        self.rolled_back = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        self.rolled_back = True
+
+    def close(self):
+        pass
+
+
+class FakeEngine:
+    def __init__(self):
+        self.conn = FakeConnection()
+
+    def raw_connection(self):
+        return self.conn
+
+
+@pytest.fixture
+def fake_engine(monkeypatch):
+    engine = FakeEngine()
+    monkeypatch.setattr(bulk, 'engine', engine)
+    return engine
+
+
+@pytest.mark.parametrize('fmt, text', [
+    ('xml', '<appointments/>'),
+    ('csv', ''),
+    ('csv', 'date,time\n2024-03-18,10:00\n'),
+])
+def test_import_rejects_bad_input_before_copy(fake_engine, fmt, text):
+    with pytest.raises(BulkInputError):
+        import_appointments(io.StringIO(text), fmt)
+    assert fake_engine.conn.statements == []
+
+
+def test_import_stages_valid_rows_and_reports_invalid_ones(fake_engine):
+    source = io.StringIO(
+        "user_id,appointment_date,appointment_time,service_type,notes\n"
+        f"{USER_ID},2024-03-18,10:00,General Consultation,\n"
+        f"{USER_ID},2024-03-18,11:00,{'x' * 300},\n"
+        f"{USER_ID},2024-03-18,12:00,General Consultation,bad\x00note\n"
+        f"{USER_ID},2024-03-18,13:00,,\n"
+    )
+
+    report = import_appointments(source, 'csv', dry_run=True)
+
+    assert report['rows_read'] == 4
+    assert report['rejected']['invalid'] == 2
+    assert [error['line'] for error in report['errors']] == [2, 3]
+    assert [row[0] for row in fake_engine.conn.staged] == ['1', '4']
+    assert fake_engine.conn.rolled_back
+
+
+def test_import_unreadable_input_is_a_client_error(fake_engine):
+    class Unreadable(io.StringIO):
+        def __iter__(self):
+            yield "user_id,appointment_date,appointment_time\n"
+            raise UnicodeDecodeError('utf-8', b'\xff', 0, 1, 'invalid start byte')
+
+    with pytest.raises(BulkInputError, match='Unreadable input'):
+        import_appointments(Unreadable(), 'csv')
+    assert fake_engine.conn.rolled_back
+    assert not fake_engine.conn.committed
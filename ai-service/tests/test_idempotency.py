@@ -0,0 +1,210 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+
+import idempotency
+from idempotency import IdempotencyStore, run_idempotent
+
+
+class Handler:
+    """Counts calls; optionally waits for a gate or raises."""
+
+    def __init__(self, result='ok', error=None, gate=None):
+        self.result = result
+        self.error = error
+        self.gate = gate
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        if self.gate:
+            await self.gate.wait()
+        if self.error:
+            raise self.error
+        return self.result
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_no_key_always_runs():
+    store = IdempotencyStore(max_entries=10, ttl_seconds=60)
+    handler = Handler()
+
+    async def scenario():
+        await run_idempotent(store, None, 'chat', {'a': 1}, handler)
+        await run_idempotent(store, None, 'chat', {'a': 1}, handler)
+
+    run(scenario())
+    assert handler.calls == 2
+
+
+def test_replay_returns_stored_result():
+    store = IdempotencyStore(max_entries=10, ttl_seconds=60)
+    handler = Handler(result={'id': 1})
+
+    async def scenario():
+        first = await run_idempotent(store, 'k', 'chat', {'a': 1}, handler)
+        second = await run_idempotent(store, 'k', 'chat', {'a': 1}, handler)
+        return first, second
+
+    assert run(scenario()) == ({'id': 1}, {'id': 1})
+    assert handler.calls == 1
+
+
+def test_scopes_do_not_share_keys():
+    store = IdempotencyStore(max_entries=10, ttl_seconds=60)
+    handler = Handler()
+
+    async def scenario():
+        await run_idempotent(store, 'k', 'chat', {}, handler)
+        await run_idempotent(store, 'k', 'appointments', {}, handler)
+
+    run(scenario())
+    assert handler.calls == 2
+
+
+def test_key_reused_with_different_body_is_rejected():
+    store = IdempotencyStore(max_entries=10, ttl_seconds=60)
+
+    async def scenario():
+        await run_idempotent(store, 'k', 'chat', {'a': 1}, Handler())
+        await run_idempotent(store, 'k', 'chat', {'a': 2}, Handler())
+
+    with pytest.raises(HTTPException) as exc:
+        run(scenario())
+    assert exc.value.status_code == 422
+
+
+def test_duplicates_in_flight_wait_for_original():
+    store = IdempotencyStore(max_entries=10, ttl_seconds=60)
+
+    async def scenario():
+        handler = Handler(result='once', gate=asyncio.Event())
+        tasks = [
+            asyncio.create_task(run_idempotent(store, 'k', 'chat', {}, handler))
+            for _ in range(3)
+        ]
+        await asyncio.sleep(0)
+        handler.gate.set()
+        return await asyncio.gather(*tasks), handler.calls
+
+    results, calls = run(scenario())
+    assert results == ['once', 'once', 'once']
+    assert calls == 1
+
+
+def test_duplicate_times_out_while_original_in_flight(monkeypatch):
+    monkeypatch.setattr(idempotency.settings, 'idempotency_wait_timeout_seconds', 0.01)
+    store = IdempotencyStore(max_entries=10, ttl_seconds=60)
+
+    async def scenario():
+        gate = asyncio.Event()
+        original = asyncio.create_task(run_idempotent(store, 'k', 'chat', {}, Handler(gate=gate)))
+        await asyncio.sleep(0)
+        try:
+            await run_idempotent(store, 'k', 'chat', {}, Handler())
+        finally:
+            gate.set()
+            await original
+
+    with pytest.raises(HTTPException) as exc:
+        run(scenario())
+    assert exc.value.status_code == 409
+
+
+def test_client_errors_are_replayed():
+    store = IdempotencyStore(max_entries=10, ttl_seconds=60)
+    handler = Handler(error=HTTPException(status_code=400, detail='bad'))
+
+    async def scenario():
+        for _ in range(2):
+            with pytest.raises(HTTPException) as exc:
+                await run_idempotent(store, 'k', 'chat', {}, handler)
+            assert exc.value.status_code == 400
+
+    run(scenario())
+    assert handler.calls == 1
+
+
+def test_server_errors_are_released_for_retry():
+    store = IdempotencyStore(max_entries=10, ttl_seconds=60)
+    failing = Handler(error=HTTPException(status_code=500, detail='boom'))
+    retry = Handler(result='retried')
+
+    async def scenario():
+        with pytest.raises(HTTPException):
+            await run_idempotent(store, 'k', 'chat', {}, failing)
+        return await run_idempotent(store, 'k', 'chat', {}, retry)
+
+    assert run(scenario()) == 'retried'
+    assert retry.calls == 1
+
+
+def test_waiting_duplicate_reruns_after_original_fails():
+    store = IdempotencyStore(max_entries=10, ttl_seconds=60)
+
+    async def scenario():
+        gate = asyncio.Event()
+        failing = Handler(error=RuntimeError('boom'), gate=gate)
+        retry = Handler(result='retried')
+        original = asyncio.create_task(run_idempotent(store, 'k', 'chat', {}, failing))
+        await asyncio.sleep(0)
+        duplicate = asyncio.create_task(run_idempotent(store, 'k', 'chat', {}, retry))
+        await asyncio.sleep(0)
+        gate.set()
+        with pytest.raises(RuntimeError):
+            await original
+        return await duplicate, retry.calls
+
+    assert run(scenario()) == ('retried', 1)
+
+
+# Eviction
+def test_capacity_never_evicts_in_flight_entries():
+    store = IdempotencyStore(max_entries=2, ttl_seconds=60)
+
+    async def scenario():
+        gate = asyncio.Event()
+        handler = Handler(result='a', gate=gate)
+        original = asyncio.create_task(run_idempotent(store, 'a', 'chat', {}, handler))
+        await asyncio.sleep(0)
+
+        # Fill the store past capacity while 'a' is still running
+        for key in ('b', 'c', 'd'):
+            await run_idempotent(store, key, 'chat', {}, Handler())
+
+        duplicate = asyncio.create_task(run_idempotent(store, 'a', 'chat', {}, handler))
+        await asyncio.sleep(0)
+        gate.set()
+        return await asyncio.gather(original, duplicate), handler.calls
+
+    results, calls = run(scenario())
+    assert results == ['a', 'a']
+    assert calls == 1
+
+
+def test_capacity_evicts_earliest_completed_first():
+    store = IdempotencyStore(max_entries=3, ttl_seconds=60)
+    entry_a, _ = store.begin('a', 'f')
+    entry_b, _ = store.begin('b', 'f')
+    store.complete(entry_b, result='b')
+    store.complete(entry_a, result='a')
+
+    store.begin('c', 'f')
+    store.begin('d', 'f')
+
+    assert list(store._entries) == ['a', 'c', 'd']
+
+
+def test_expired_entries_are_dropped():
+    store = IdempotencyStore(max_entries=10, ttl_seconds=0)
+    entry, _ = store.begin('a', 'f')
+    store.complete(entry, result='a')
+    time.sleep(0.001)
+
+    _, owner = store.begin('a', 'f')
+    assert owner
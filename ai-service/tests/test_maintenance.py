@@ -0,0 +1,131 @@
+import maintenance
+from maintenance import (
+    EXPIRE_IDLE_SESSIONS,
+    JobRunner,
+    PeriodicJob,
+    _run_batched,
+    expire_idle_sessions,
+)
+
+
+class FakeResult:
+    def __init__(self, rowcount=0, scalar=None):
+        self.rowcount = rowcount
+        self._scalar = scalar
+
+    def scalar(self):
+        return self._scalar
+
+
+class FakeConnection:
+    """Records statements; UPDATEs report the next queued rowcount."""
+
+    def __init__(self, rowcounts=(), lock_acquired=True):
+        self.rowcounts = list(rowcounts)
+        self.lock_acquired = lock_acquired
+        self.statements = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    def execute(self, statement, params=None):
+        sql = str(statement)
+        self.statements.append((sql, params))
+        if 'pg_try_advisory_lock' in sql:
+            return FakeResult(scalar=self.lock_acquired)
+        if 'pg_advisory_unlock' in sql:
+            return FakeResult(scalar=True)
+        return FakeResult(rowcount=self.rowcounts.pop(0) if self.rowcounts else 0)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeEngine:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def connect(self):
+        return self.conn
+
+
+def executed(conn, fragment):
+    return [sql for sql, _ in conn.statements if fragment in sql]
+
+
+# Batching
+def test_run_batched_repeats_until_short_batch(monkeypatch):
+    monkeypatch.setattr(maintenance.settings, 'maintenance_batch_size', 10)
+    conn = FakeConnection(rowcounts=[10, 10, 3])
+
+    assert _run_batched(conn, EXPIRE_IDLE_SESSIONS, {'timeout_minutes': 30}) == 23
+    assert len(conn.statements) == 3
+    assert conn.commits == 3
+    assert conn.statements[0][1] == {'timeout_minutes': 30, 'batch_size': 10}
+
+
+def test_expire_idle_sessions_uses_timeout_and_utc(monkeypatch):
+    monkeypatch.setattr(maintenance.settings, 'session_timeout_minutes', 45)
+    conn = FakeConnection(rowcounts=[0])
+
+    assert expire_idle_sessions(conn) == 0
+    sql, params = conn.statements[0]
+    assert params['timeout_minutes'] == 45
+    # Timestamps are written with datetime.utcnow, so compare in UTC
+    assert "now() AT TIME ZONE 'utc'" in sql
+    assert 'LOCALTIMESTAMP' not in sql
+
+
+# Runner
+def test_run_job_holds_lock_and_records_stats(monkeypatch):
+    conn = FakeConnection()
+    monkeypatch.setattr(maintenance, 'engine', FakeEngine(conn))
+    job = PeriodicJob('test', 60, lambda c: 7)
+
+    JobRunner([job]).run_job(job)
+
+    assert job.stats['runs'] == 1
+    assert job.stats['last_rows'] == 7
+    assert job.stats['total_rows'] == 7
+    assert len(executed(conn, 'pg_advisory_unlock')) == 1
+
+
+def test_run_job_skips_when_lock_is_held_elsewhere(monkeypatch):
+    conn = FakeConnection(lock_acquired=False)
+    monkeypatch.setattr(maintenance, 'engine', FakeEngine(conn))
+    calls = []
+    job = PeriodicJob('test', 60, lambda c: calls.append(c) or 0)
+
+    JobRunner([job]).run_job(job)
+
+    assert calls == []
+    assert job.stats['skipped'] == 1
+    assert executed(conn, 'pg_advisory_unlock') == []
+
+
+def test_run_job_failure_rolls_back_and_unlocks(monkeypatch):
+    conn = FakeConnection()
+    monkeypatch.setattr(maintenance, 'engine', FakeEngine(conn))
+
+    def fail(c):
+        raise RuntimeError('boom')
+
+    job = PeriodicJob('test', 60, fail)
+    JobRunner([job]).run_job(job)
+
+    assert job.stats['failures'] == 1
+    assert job.stats['last_error'] == 'boom'
+    assert conn.rollbacks == 1
+    assert len(executed(conn, 'pg_advisory_unlock')) == 1
+
+
+def test_lock_keys_differ_per_job():
+    assert PeriodicJob('a', 1, None).lock_key != PeriodicJob('b', 1, None).lock_key
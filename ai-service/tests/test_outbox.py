@@ -0,0 +1,124 @@
+import uuid
+
+import pytest
+
+import outbox
+from outbox import CLAIM_BATCH, MARK_FAILED, MARK_SENT, NotificationSink, OutboxDispatcher
+
+
+class FakeMappings:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def all(self):
+        return self.rows
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def mappings(self):
+        return FakeMappings(self.rows)
+
+
+class FakeEngine:
+    """Returns queued rows for the claim and records every other statement."""
+
+    def __init__(self, claimed):
+        self.claimed = claimed
+        self.executed = []
+
+    def begin(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, statement, params=None):
+        self.executed.append((statement, params))
+        return FakeResult(self.claimed if statement is CLAIM_BATCH else [])
+
+    def params_for(self, statement):
+        return [params for executed, params in self.executed if executed is statement]
+
+
+class FakeSink(NotificationSink):
+    """Fails for the configured e-mail addresses."""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.sent = []
+
+    def send(self, message):
+        if message['email'] in self.failing:
+            raise ConnectionError(f"cannot reach {message['email']}")
+        self.sent.append(message)
+
+
+def row(email, attempts=1):
+    return {
+        'id': uuid.uuid4(),
+        'event_type': 'appointment_confirmation',
+        'payload': {'date': '2024-03-18'},
+        'attempts': attempts,
+        'email': email,
+        'full_name': email.split('@')[0]
+    }
+
+
+@pytest.fixture
+def backoff(monkeypatch):
+    monkeypatch.setattr(outbox.settings, 'outbox_backoff_seconds', 5.0)
+    monkeypatch.setattr(outbox.settings, 'outbox_max_backoff_seconds', 60.0)
+    monkeypatch.setattr(outbox.settings, 'outbox_max_attempts', 8)
+
+
+def dispatch(monkeypatch, rows, sink):
+    engine = FakeEngine(rows)
+    monkeypatch.setattr(outbox, 'engine', engine)
+    return OutboxDispatcher(sink).dispatch_batch(), engine
+
+
+def test_empty_claim_touches_nothing(monkeypatch):
+    claimed, engine = dispatch(monkeypatch, [], FakeSink())
+    assert claimed == 0
+    assert [statement for statement, _ in engine.executed] == [CLAIM_BATCH]
+
+
+def test_sent_and_failed_rows_are_settled_separately(monkeypatch, backoff):
+    ok, bad = row('ok@example.com'), row('bad@example.com', attempts=2)
+    sink = FakeSink(failing={'bad@example.com'})
+
+    claimed, engine = dispatch(monkeypatch, [ok, bad], sink)
+
+    assert claimed == 2
+    assert [message['email'] for message in sink.sent] == ['ok@example.com']
+    assert engine.params_for(MARK_SENT) == [{'ids': [str(ok['id'])]}]
+    assert engine.params_for(MARK_FAILED) == [[{
+        'id': bad['id'],
+        'error': 'cannot reach bad@example.com',
+        'max_attempts': 8,
+        'delay_seconds': 10.0
+    }]]
+
+
+def test_all_sent_skips_failure_update(monkeypatch):
+    _, engine = dispatch(monkeypatch, [row('a@example.com'), row('b@example.com')], FakeSink())
+    assert len(engine.params_for(MARK_SENT)[0]['ids']) == 2
+    assert engine.params_for(MARK_FAILED) == []
+
+
+@pytest.mark.parametrize('attempts, delay', [(1, 5.0), (2, 10.0), (3, 20.0), (4, 40.0), (5, 60.0), (12, 60.0)])
+def test_backoff_doubles_per_attempt_up_to_max(monkeypatch, backoff, attempts, delay):
+    failing = row('bad@example.com', attempts=attempts)
+    _, engine = dispatch(monkeypatch, [failing], FakeSink(failing={'bad@example.com'}))
+    assert engine.params_for(MARK_FAILED)[0][0]['delay_seconds'] == delay
+
+
+def test_sink_must_implement_send():
+    with pytest.raises(TypeError):
+        NotificationSink()
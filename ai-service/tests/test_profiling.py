@@ -0,0 +1,116 @@
+import json
+from uuid import uuid4
+
+from langchain.schema import AIMessage, HumanMessage, SystemMessage
+from langchain.schema.output import ChatGeneration, LLMResult
+
+from profiling import TokenCounter, TurnProfiler
+
+TOOLS = [{'type': 'function', 'function': {'name': 'check_availability', 'parameters': {}}}]
+
+
+class WordTokenizerLLM:
+    """Counts one token per whitespace-separated word."""
+
+    def __init__(self):
+        self.text_calls = 0
+
+    def get_num_tokens(self, text):
+        self.text_calls += 1
+        return len(text.split())
+
+    def get_num_tokens_from_messages(self, messages):
+        return sum(len(message.content.split()) for message in messages)
+
+
+class BrokenLLM:
+    def get_num_tokens(self, text):
+        raise OSError("no tokenizer")
+
+    def get_num_tokens_from_messages(self, messages):
+        raise OSError("no tokenizer")
+
+
+def run_llm_call(profiler, messages, output, invocation_params=None, llm_output=None):
+    run_id = uuid4()
+    profiler.on_chat_model_start(
+        {}, [messages], run_id=run_id, invocation_params=invocation_params or {}
+    )
+    profiler.on_llm_end(
+        LLMResult(generations=[[ChatGeneration(message=output)]], llm_output=llm_output),
+        run_id=run_id
+    )
+
+
+def test_counts_streamed_calls_including_tool_schemas():
+    llm = WordTokenizerLLM()
+    profiler = TurnProfiler("hi", token_counter=TokenCounter(llm))
+    messages = [SystemMessage(content="you book appointments"), HumanMessage(content="any slots monday")]
+
+    run_llm_call(profiler, messages, AIMessage(content="let me check"), {'tools': TOOLS})
+
+    schema_tokens = llm.get_num_tokens(json.dumps(TOOLS, sort_keys=True))
+    step = profiler.profile()['steps'][0]
+    assert step['prompt_tokens'] == 6 + schema_tokens
+    assert step['completion_tokens'] == 3
+    assert step['token_source'] == 'counted'
+
+
+def test_tool_call_arguments_count_as_completion():
+    profiler = TurnProfiler("hi", token_counter=TokenCounter(WordTokenizerLLM()))
+    output = AIMessage(content="", additional_kwargs={'tool_calls': [
+        {'id': 'c1', 'type': 'function', 'function': {'name': 'check_availability', 'arguments': ' 2024 03 18'}}
+    ]})
+
+    run_llm_call(profiler, [HumanMessage(content="slots")], output)
+
+    assert profiler.profile()['steps'][0]['completion_tokens'] == 4
+
+
+def test_schema_tokens_are_cached():
+    llm = WordTokenizerLLM()
+    counter = TokenCounter(llm)
+    counter.count_schemas({'tools': TOOLS})
+    counter.count_schemas({'tools': TOOLS})
+    assert llm.text_calls == 1
+    assert counter.count_schemas({}) == 0
+
+
+def test_reported_usage_wins():
+    profiler = TurnProfiler("hi", token_counter=TokenCounter(WordTokenizerLLM()))
+    run_llm_call(
+        profiler, [HumanMessage(content="slots")], AIMessage(content="ok"),
+        llm_output={'token_usage': {'prompt_tokens': 100, 'completion_tokens': 7}}
+    )
+    profile = profiler.profile()
+    assert (profile['prompt_tokens'], profile['completion_tokens']) == (100, 7)
+    assert profile['steps'][0]['token_source'] == 'reported'
+
+
+def test_falls_back_to_estimates_without_tokenizer():
+    counter = TokenCounter(BrokenLLM())
+    counter.prime()
+    assert not counter.exact
+
+    profiler = TurnProfiler("hi", token_counter=counter)
+    run_llm_call(profiler, [HumanMessage(content="x" * 40)], AIMessage(content="y" * 20))
+
+    profile = profiler.profile()
+    assert profile['prompt_tokens'] > 0
+    assert profile['completion_tokens'] == 5
+    assert profile['tokens_estimated']
+
+
+def test_profile_counts_iterations_and_tools():
+    profiler = TurnProfiler("hi", max_iterations=2)
+    run_llm_call(profiler, [HumanMessage(content="a")], AIMessage(content="b"))
+    tool_run = uuid4()
+    profiler.on_tool_start({'name': 'view_appointments'}, '', run_id=tool_run)
+    profiler.on_tool_end('none', run_id=tool_run)
+    run_llm_call(profiler, [HumanMessage(content="a")], AIMessage(content="b"))
+
+    profile = profiler.profile()
+    assert profile['iterations'] == 2
+    assert profile['tool_calls'] == 1
+    assert profile['hit_max_iterations']
+    assert profile['steps'][1]['tool'] == 'view_appointments'
@@ -0,0 +1,108 @@
+import pytest
+
+from database import ReplicaRouter
+
+
+class FakeResult:
+    def __init__(self, value):
+        self.value = value
+
+    def scalar(self):
+        return self.value
+
+
+class FakeEngine:
+    """Engine whose lag check returns `lag` (or raises `error`)."""
+
+    def __init__(self, name, lag=0.0, error=None):
+        self.name = name
+        self.lag = lag
+        self.error = error
+        self.checks = 0
+
+    def connect(self):
+        self.checks += 1
+        if self.error:
+            raise self.error
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, statement):
+        return FakeResult(self.lag)
+
+    @property
+    def url(self):
+        return self
+
+    def render_as_string(self, hide_password=True):
+        return self.name
+
+
+PRIMARY = FakeEngine('primary')
+
+
+def router(*replicas, max_lag=5.0, check_interval=0.0, pin_seconds=60.0) -> ReplicaRouter:
+    return ReplicaRouter(PRIMARY, list(replicas), max_lag, check_interval, pin_seconds)
+
+
+def test_no_replicas_uses_primary():
+    assert router().choose('user') is PRIMARY
+
+
+def test_round_robin_over_healthy_replicas():
+    a, b = FakeEngine('a'), FakeEngine('b')
+    r = router(a, b)
+    chosen = [r.choose() for _ in range(4)]
+    assert chosen == [a, b, a, b]
+
+
+@pytest.mark.parametrize('replica, reported_lag', [
+    (FakeEngine('lagging', lag=30.0), 30.0),
+    (FakeEngine('unknown', lag=None), None),  # behind, no replay timestamp yet
+    (FakeEngine('down', error=OSError('connection timed out')), None),
+])
+def test_unhealthy_replica_falls_back_to_primary(replica, reported_lag):
+    r = router(replica)
+    assert r.choose() is PRIMARY
+    assert r.status() == [{'replica': replica.name, 'lag_seconds': reported_lag, 'healthy': False}]
+
+
+def test_unhealthy_replica_is_skipped():
+    healthy, lagging = FakeEngine('healthy', lag=1.0), FakeEngine('lagging', lag=None)
+    r = router(healthy, lagging)
+    assert {r.choose() for _ in range(4)} == {healthy}
+    assert r.status()[0] == {'replica': 'healthy', 'lag_seconds': 1.0, 'healthy': True}
+
+
+def test_lag_is_rechecked_only_after_interval():
+    replica = FakeEngine('a', lag=1.0)
+    r = router(replica, check_interval=3600)
+    for _ in range(5):
+        r.choose()
+    assert replica.checks == 1
+
+    # Cached result is used even if the replica has since fallen behind
+    replica.lag = 30.0
+    assert r.choose() is replica
+
+
+def test_writes_pin_keys_to_primary():
+    replica = FakeEngine('a')
+    r = router(replica)
+    r.note_write('User-1', None)
+
+    assert r.choose('user-1') is PRIMARY
+    assert r.choose('user-2') is replica
+    assert r.choose() is replica
+
+
+def test_pin_expires():
+    replica = FakeEngine('a')
+    r = router(replica, pin_seconds=0)
+    r.note_write('user-1')
+    assert r.choose('user-1') is replica
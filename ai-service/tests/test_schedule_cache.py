@@ -0,0 +1,164 @@
+import json
+from datetime import date, time, timedelta
+
+from schedule_cache import DaySchedule, ScheduleCache, ScheduleListener, occupancy_bitmap
+
+MONDAY = date(2024, 3, 18)
+TUESDAY = date(2024, 3, 19)
+
+
+class InMemoryScheduleCache(ScheduleCache):
+    """ScheduleCache that loads days from a dict instead of the database."""
+
+    def __init__(self, bookings=None, ttl_seconds=3600, during_load=None):
+        super().__init__(ttl_seconds)
+        self.bookings = bookings or {}
+        self.during_load = during_load
+        self.loads = 0
+
+    def _load(self, db, start_date, end_date, now):
+        self.loads += 1
+        if self.during_load:
+            self.during_load(self)
+        return {
+            start_date + timedelta(days=n): DaySchedule(
+                now, dict(self.bookings.get(start_date + timedelta(days=n), {}))
+            )
+            for n in range((end_date - start_date).days + 1)
+        }
+
+
+def listening_cache(**kwargs) -> InMemoryScheduleCache:
+    cache = InMemoryScheduleCache(**kwargs)
+    cache.set_listening(True)
+    return cache
+
+
+# occupancy_bitmap
+def test_bitmap_empty_day():
+    assert occupancy_bitmap([]) == 0
+
+
+def test_bitmap_marks_each_overlapped_slot():
+    assert occupancy_bitmap([(time(9), time(10))]) == 0b1
+    assert occupancy_bitmap([(time(10, 30), time(11, 30))]) == 0b110
+    assert occupancy_bitmap([(time(16), time(17))]) == 0b10000000
+
+
+def test_bitmap_ignores_bookings_outside_business_hours():
+    assert occupancy_bitmap([(time(8), time(9)), (time(17), time(18))]) == 0
+
+
+# Serving and storing
+def test_not_listening_never_caches():
+    cache = InMemoryScheduleCache()
+    cache.get_booked_intervals(None, MONDAY)
+    cache.get_booked_intervals(None, MONDAY)
+    assert cache.loads == 2
+
+
+def test_listening_serves_from_cache():
+    cache = listening_cache(bookings={MONDAY: {'a': (time(9), time(10))}})
+    assert cache.get_booked_intervals(None, MONDAY) == [(time(9), time(10))]
+    assert cache.get_booked_intervals(None, MONDAY) == [(time(9), time(10))]
+    assert cache.loads == 1
+
+
+def test_range_loads_missing_days_once():
+    cache = listening_cache(bookings={TUESDAY: {'a': (time(9), time(11))}})
+    assert cache.get_day_occupancy(None, MONDAY, TUESDAY) == {MONDAY: 0, TUESDAY: 0b11}
+    cache.get_day_occupancy(None, MONDAY, TUESDAY)
+    assert cache.loads == 1
+
+
+def test_expired_entries_are_reloaded():
+    cache = listening_cache(ttl_seconds=0)
+    cache.get_booked_intervals(None, MONDAY)
+    cache.get_booked_intervals(None, MONDAY)
+    assert cache.loads == 2
+
+
+def test_put_and_remove_patch_cached_day():
+    cache = listening_cache()
+    cache.get_day_occupancy(None, MONDAY, MONDAY)
+
+    cache.put_booking(MONDAY, 'a', time(13), time(14))
+    assert cache.get_day_occupancy(None, MONDAY, MONDAY) == {MONDAY: 0b10000}
+
+    cache.remove_booking(MONDAY, 'a')
+    assert cache.get_day_occupancy(None, MONDAY, MONDAY) == {MONDAY: 0}
+    assert cache.loads == 1
+
+
+# Loads racing with changes
+def test_day_changed_during_load_is_not_stored():
+    cache = listening_cache(
+        during_load=lambda c: c.put_booking(MONDAY, 'a', time(9), time(10))
+    )
+    cache.get_day_occupancy(None, MONDAY, TUESDAY)
+
+    cache.during_load = None
+    cache.get_booked_intervals(None, TUESDAY)
+    assert cache.loads == 1  # untouched day was stored
+    cache.get_booked_intervals(None, MONDAY)
+    assert cache.loads == 2  # changed day was loaded again
+
+
+def test_reset_during_load_stores_nothing():
+    cache = listening_cache(during_load=lambda c: c.invalidate_all())
+    cache.get_day_occupancy(None, MONDAY, TUESDAY)
+
+    cache.during_load = None
+    cache.get_day_occupancy(None, MONDAY, TUESDAY)
+    assert cache.loads == 2
+
+
+def test_listener_drop_during_load_stores_nothing():
+    cache = listening_cache(during_load=lambda c: c.set_listening(False))
+    cache.get_booked_intervals(None, MONDAY)
+
+    cache.during_load = None
+    cache.set_listening(True)
+    cache.get_booked_intervals(None, MONDAY)
+    assert cache.loads == 2
+
+
+# Notification handling
+def _event(op, old=None, new=None, table='appointments'):
+    return json.dumps({'table': table, 'op': op, 'id': 'a', 'old': old, 'new': new})
+
+
+def test_listener_moves_rescheduled_booking():
+    cache = listening_cache(bookings={MONDAY: {'a': (time(9), time(10))}})
+    cache.get_day_occupancy(None, MONDAY, TUESDAY)
+
+    ScheduleListener(cache)._handle(_event(
+        'UPDATE',
+        old={'date': '2024-03-18', 'start': '09:00:00', 'end': '10:00:00', 'status': 'scheduled'},
+        new={'date': '2024-03-19', 'start': '11:00:00', 'end': '12:00:00', 'status': 'scheduled'}
+    ))
+
+    assert cache.get_day_occupancy(None, MONDAY, TUESDAY) == {MONDAY: 0, TUESDAY: 0b100}
+    assert cache.loads == 1
+
+
+def test_listener_drops_cancelled_booking():
+    cache = listening_cache(bookings={MONDAY: {'a': (time(9), time(10))}})
+    cache.get_booked_intervals(None, MONDAY)
+
+    ScheduleListener(cache)._handle(_event(
+        'UPDATE',
+        old={'date': '2024-03-18', 'start': '09:00:00', 'end': '10:00:00', 'status': 'scheduled'},
+        new={'date': '2024-03-18', 'start': '09:00:00', 'end': '10:00:00', 'status': 'cancelled'}
+    ))
+
+    assert cache.get_booked_intervals(None, MONDAY) == []
+
+
+def test_listener_resyncs_on_bulk_slot_and_malformed_events():
+    for payload in (_event('BULK'), _event('UPDATE', table='availability_slots'), 'not json'):
+        cache = listening_cache()
+        cache.get_booked_intervals(None, MONDAY)
+        ScheduleListener(cache)._handle(payload)
+        cache.get_booked_intervals(None, MONDAY)
+        assert cache.loads == 2
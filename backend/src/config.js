@@ -1,5 +1,13 @@
 require('dotenv').config();
 
+/**
+ * Parse an integer env var, keeping 0 (unlike `parseInt(x) || fallback`)
+ */
+function intFromEnv(value, fallback) {
+  const parsed = parseInt(value, 10);
+  return Number.isNaN(parsed) ? fallback : parsed;
+}
+
 module.exports = {
   port: process.env.PORT || 4000,
   nodeEnv: process.env.NODE_ENV || 'development',
@@ -16,6 +24,9 @@ module.exports = {
   
   aiService: {
     url: process.env.AI_SERVICE_URL || 'http://localhost:8000',
+    timeoutMs: parseInt(process.env.AI_SERVICE_TIMEOUT_MS) || 60000,
+    retries: intFromEnv(process.env.AI_SERVICE_RETRIES, 2),
+    retryDelayMs: intFromEnv(process.env.AI_SERVICE_RETRY_DELAY_MS, 250),
   },
   
   cors: {
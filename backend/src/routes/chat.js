@@ -23,8 +23,13 @@ router.post('/message',
       const { message, sessionId } = req.body;
       const userId = req.userId;
       
-      // Send message to AI service
-      const response = await chatService.sendMessage(userId, message, sessionId);
+      // Send message to AI service (client retries carry the same Idempotency-Key)
+      const response = await chatService.sendMessage(
+        userId,
+        message,
+        sessionId,
+        req.get('Idempotency-Key')
+      );
       
       res.json({
         success: true,
@@ -6,20 +6,44 @@ const { v4: uuidv4 } = require('uuid');
 const AI_SERVICE_URL = config.aiService.url;
 
 /**
- * Send message to AI chatbot service
+ * Whether a failed AI service call is safe to retry (timeouts, network errors, 5xx)
  */
-async function sendMessage(userId, message, sessionId = null) {
-  try {
-    const response = await axios.post(`${AI_SERVICE_URL}/chat`, {
-      user_id: userId,
-      message: message,
-      session_id: sessionId,
-    });
-    
-    return response.data;
-  } catch (error) {
-    console.error('AI Service error:', error.message);
-    throw new Error('Failed to communicate with AI service');
+function isRetryable(error) {
+  return !error.response || error.response.status >= 500;
+}
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+/**
+ * Send message to AI chatbot service.
+ * Retries reuse the same Idempotency-Key, so the AI service replays the
+ * original response instead of running the agent again.
+ */
+async function sendMessage(userId, message, sessionId = null, idempotencyKey = null) {
+  const key = idempotencyKey || uuidv4();
+  const { retries, retryDelayMs, timeoutMs } = config.aiService;
+  
+  for (let attempt = 0; ; attempt++) {
+    try {
+      const response = await axios.post(`${AI_SERVICE_URL}/chat`, {
+        user_id: userId,
+        message: message,
+        session_id: sessionId,
+      }, {
+        headers: { 'Idempotency-Key': key },
+        timeout: timeoutMs,
+      });
+      
+      return response.data;
+    } catch (error) {
+      if (attempt < retries && isRetryable(error)) {
+        // Exponential backoff: retryDelayMs, 2x, 4x, ...
+        await sleep(retryDelayMs * 2 ** attempt);
+        continue;
+      }
+      console.error('AI Service error:', error.message);
+      throw new Error('Failed to communicate with AI service');
+    }
   }
 }
 
@@ -78,6 +78,10 @@ CREATE INDEX idx_chat_sessions_started_at ON chat_sessions(started_at);
 CREATE INDEX idx_chat_sessions_is_active ON chat_sessions(is_active);
 CREATE INDEX idx_chat_sessions_business_id ON chat_sessions(business_id);
 
+-- Partial index for the idle session expiry job
+CREATE INDEX idx_chat_sessions_active_started_at ON chat_sessions(started_at)
+WHERE is_active;
+
 -- ============================================
 -- Table: chat_messages
 -- Stores individual chat messages
@@ -116,6 +120,30 @@ CREATE TABLE availability_slots (
 -- Index for availability lookup
 CREATE INDEX idx_availability_day_time ON availability_slots(day_of_week, start_time, is_available);
 
+-- ============================================
+-- Table: notification_outbox
+-- Outgoing notifications, written in the same
+-- transaction as the appointment change
+-- ============================================
+CREATE TABLE notification_outbox (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    event_type VARCHAR(50) NOT NULL CHECK (event_type IN ('appointment_confirmation', 'appointment_cancellation', 'appointment_reminder')),
+    appointment_id UUID REFERENCES appointments(id) ON DELETE CASCADE,
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    payload JSONB NOT NULL,
+    status VARCHAR(20) DEFAULT 'pending' CHECK (status IN ('pending', 'sent', 'failed', 'cancelled')),
+    attempts INTEGER DEFAULT 0,
+    available_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, -- Earliest (next) delivery attempt
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    sent_at TIMESTAMP,
+    last_error TEXT
+);
+
+-- Partial index for dispatcher claims (only pending rows are scanned)
+CREATE INDEX idx_notification_outbox_pending ON notification_outbox(available_at)
+WHERE status = 'pending';
+CREATE INDEX idx_notification_outbox_appointment_id ON notification_outbox(appointment_id);
+
 -- ============================================
 -- Table: refresh_tokens
 -- Store refresh tokens for JWT authentication
@@ -156,6 +184,68 @@ CREATE TRIGGER update_users_updated_at BEFORE UPDATE ON users
 CREATE TRIGGER update_appointments_updated_at BEFORE UPDATE ON appointments
     FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 
+-- Function to publish schedule changes to listeners (AI service cache)
+-- Payload: {"table": ..., "op": ..., "id": ..., "old": {...}, "new": {...}}
+-- where old/new hold date, start, end and status of the appointment row.
+-- Bulk imports set app.bulk_import = 'on' and send a single "BULK" event instead.
+CREATE OR REPLACE FUNCTION notify_schedule_change()
+RETURNS TRIGGER AS $$
+DECLARE
+    row_id UUID;
+    old_row JSON;
+    new_row JSON;
+BEGIN
+    IF current_setting('app.bulk_import', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+
+    IF TG_TABLE_NAME = 'appointments' THEN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            row_id := OLD.id;
+            old_row := json_build_object(
+                'date', OLD.appointment_date,
+                'start', OLD.appointment_time,
+                'end', OLD.end_time,
+                'status', OLD.status
+            );
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            row_id := NEW.id;
+            new_row := json_build_object(
+                'date', NEW.appointment_date,
+                'start', NEW.appointment_time,
+                'end', NEW.end_time,
+                'status', NEW.status
+            );
+        END IF;
+    END IF;
+
+    -- Channel name must match SCHEDULE_NOTIFY_CHANNEL in ai-service/schedule_cache.py
+    PERFORM pg_notify(
+        'schedule_changes',
+        json_build_object(
+            'table', TG_TABLE_NAME,
+            'op', TG_OP,
+            'id', row_id,
+            'old', old_row,
+            'new', new_row
+        )::text
+    );
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+-- Triggers for schedule change notifications
+CREATE TRIGGER notify_appointments_insert_delete AFTER INSERT OR DELETE ON appointments
+    FOR EACH ROW EXECUTE FUNCTION notify_schedule_change();
+
+CREATE TRIGGER notify_appointments_update
+    AFTER UPDATE OF appointment_date, appointment_time, end_time, status ON appointments
+    FOR EACH ROW EXECUTE FUNCTION notify_schedule_change();
+
+CREATE TRIGGER notify_availability_slots_change AFTER INSERT OR UPDATE OR DELETE ON availability_slots
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_schedule_change();
+
 -- ============================================
 -- Views
 -- ============================================
@@ -2,6 +2,19 @@ import axios from 'axios';
 
 const API_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:4000';
 
+// crypto.randomUUID() is only available in secure contexts (HTTPS or localhost);
+// fall back to a v4 UUID built from crypto.getRandomValues() elsewhere
+function newIdempotencyKey(): string {
+  if (typeof crypto.randomUUID === 'function') {
+    return crypto.randomUUID();
+  }
+  const bytes = crypto.getRandomValues(new Uint8Array(16));
+  bytes[6] = (bytes[6] & 0x0f) | 0x40;
+  bytes[8] = (bytes[8] & 0x3f) | 0x80;
+  const hex = Array.from(bytes, (b) => b.toString(16).padStart(2, '0')).join('');
+  return `${hex.slice(0, 8)}-${hex.slice(8, 12)}-${hex.slice(12, 16)}-${hex.slice(16, 20)}-${hex.slice(20)}`;
+}
+
 // Create axios instance
 const api = axios.create({
   baseURL: API_URL,
@@ -78,8 +91,11 @@ export const authAPI = {
 
 // Chat API
 export const chatAPI = {
+  // The key is kept when this request is retried (e.g. after a token refresh)
   sendMessage: (message: string, sessionId?: string) =>
-    api.post('/api/chat/message', { message, sessionId }),
+    api.post('/api/chat/message', { message, sessionId }, {
+      headers: { 'Idempotency-Key': newIdempotencyKey() },
+    }),
   
   getChatHistory: (sessionId: string, limit = 50) =>
     api.get(`/api/chat/history/${sessionId}`, { params: { limit } }),